@@ -0,0 +1,30 @@
+from django.core.handlers import asgi
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """ASGIHandler, который умеет отдавать асинхронный потоковый ответ.
+
+    Django 3.2 перебирает streaming_content синхронно; части ответа
+    представлений из пула (api.async_views) лежат в
+    async_streaming_content и отправляются по мере чтения.
+    """
+
+    async def send_response(self, response, send):
+        content = getattr(response, 'async_streaming_content', None)
+        if content is None:
+            return await super().send_response(response, send)
+
+        async def send_content(message):
+            # синхронная часть пуста: перед закрывающим сообщением
+            # отправляются части из пула
+            if message['type'] == 'http.response.body':
+                async for part in content:
+                    for chunk, _ in self.chunk_bytes(part):
+                        await send({'type': 'http.response.body',
+                                    'body': chunk, 'more_body': True})
+            await send(message)
+
+        try:
+            await super().send_response(response, send_content)
+        finally:
+            await content.aclose()
@@ -0,0 +1,146 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import URLPattern, URLResolver
+
+# пул ограничивает и число потоков, и число соединений с БД в процессе
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_VIEW_WORKERS, thread_name_prefix='async-views'
+)
+
+# частей потокового ответа, прочитанных впрок
+STREAM_BUFFER = 8
+# сколько поток пула ждёт, пока клиент заберёт очередную часть (секунды)
+STREAM_TIMEOUT = 60
+END = object()
+
+
+class ResponseStream:
+    """Ответ представления и части потокового ответа из потока пула.
+
+    Части читает тот же поток, что выполнял представление: ему
+    принадлежат соединение с БД и серверный курсор. Очередь ограничена -
+    поток ждёт, пока клиент заберёт прочитанное, и выгрузка не копится
+    в памяти.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.response = loop.create_future()
+        self.queue = asyncio.Queue(STREAM_BUFFER)
+        self.closed = False
+
+    def start(self, response=None, error=None):
+        if error is None:
+            callback = functools.partial(self.response.set_result, response)
+        else:
+            callback = functools.partial(self.response.set_exception, error)
+        self.loop.call_soon_threadsafe(callback)
+
+    def put(self, item):
+        if self.closed:
+            return
+        future = asyncio.run_coroutine_threadsafe(
+            self.queue.put(item), self.loop)
+        try:
+            future.result(STREAM_TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            self.closed = True
+
+    def produce(self, content):
+        try:
+            for part in content:
+                self.put(part)
+                # клиент отключился или не читает ответ
+                if self.closed:
+                    return
+        except Exception as error:
+            self.put(error)
+            return
+        self.put(END)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.queue.get()
+        if item is END:
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    async def aclose(self):
+        # освобождённое место в очереди будит ждущий поток пула
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+def run_view(view, request, args, kwargs, stream):
+    """Синхронное представление целиком в потоке пула.
+
+    Рендеринг и чтение потокового ответа тоже выполняются здесь: Django 3.2
+    перебирает streaming_content в цикле событий, где ORM недоступен.
+    Поток занят, пока клиент не получит весь потоковый ответ.
+    """
+    close_old_connections()
+    recorder = getattr(request, 'query_recorder', None)
+    try:
+        with recorder.install() if recorder else nullcontext():
+            try:
+                response = view(request, *args, **kwargs)
+                if response.streaming:
+                    # цикл событий заменит streaming_content пустым
+                    content = response.streaming_content
+                elif hasattr(response, 'render'):
+                    response.render()
+            except Exception as error:
+                stream.start(error=error)
+                return
+            stream.start(response)
+            if response.streaming:
+                stream.produce(content)
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Асинхронная обёртка: цикл событий не ждёт ORM и сериализацию.
+
+    Потоковый ответ отдаётся по частям из async_streaming_content
+    (api.asgi.ASGIHandler).
+    """
+    async def wrapper(request, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        stream = ResponseStream(loop)
+        loop.run_in_executor(
+            executor, run_view, view, request, args, kwargs, stream)
+        response = await stream.response
+        if response.streaming:
+            response.streaming_content = ()
+            response.async_streaming_content = stream
+        return response
+
+    # cls, actions и csrf_exempt нужны middleware и инструментированию
+    return functools.wraps(view)(wrapper)
+
+
+def async_patterns(patterns):
+    """URL-шаблоны, в которых все представления обёрнуты в async_view."""
+    wrapped = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            pattern = URLResolver(
+                pattern.pattern, async_patterns(pattern.url_patterns),
+                pattern.default_kwargs, pattern.app_name, pattern.namespace)
+        else:
+            pattern = URLPattern(pattern.pattern, async_view(pattern.callback),
+                                 pattern.default_args, pattern.name)
+        wrapped.append(pattern)
+    return wrapped
@@ -0,0 +1,80 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+TOKEN_KEY = 'auth:token:{}'
+# пароль и счётчики в кэш не попадают: при обращении к ним (и только тогда)
+# Django догрузит отложенные поля из БД, а save() не перезапишет их
+CACHED_FIELDS = {'id', 'email', 'username', 'first_name', 'last_name',
+                 'is_active', 'is_staff', 'is_superuser'}
+# Model.from_db ждёт значения в порядке полей модели
+USER_FIELDS = tuple(field.attname for field in User._meta.concrete_fields
+                    if field.attname in CACHED_FIELDS)
+
+
+class CacheStats:
+    """Счётчики попаданий в кэш токенов (в пределах процесса)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / total if total else 0.0}
+
+
+token_cache_stats = CacheStats()
+
+
+def token_cache_key(key):
+    # сам токен в ключ не пишем - общий кэш может быть доступен не только API
+    return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def invalidate_token(key):
+    cache.delete(token_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кэшированием токен -> пользователь.
+
+    Запись живёт TOKEN_CACHE_TIMEOUT секунд и удаляется сигналами при
+    выходе (удалении токена), смене пароля и деактивации пользователя.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        values = cache.get(cache_key)
+        token_cache_stats.record(values is not None)
+        if values is None:
+            user, token = super().authenticate_credentials(key)
+            values = [getattr(user, field) for field in USER_FIELDS]
+            cache.set(cache_key, values, settings.TOKEN_CACHE_TIMEOUT)
+            return user, token
+        user = User.from_db(router.db_for_read(User), USER_FIELDS, values)
+        # та же проверка, что в TokenAuthentication
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        return user, Token(key=key, user=user)
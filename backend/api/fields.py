@@ -1,14 +1,127 @@
 import base64
+import binascii
+import io
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
+from django.core.files import File
+from django.core.files.storage import default_storage
+from PIL import Image, UnidentifiedImageError
 from rest_framework import serializers
 
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+MAX_IMAGE_DIMENSION = 4096
+ALLOWED_IMAGE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif',
+                         'WEBP': 'webp'}
+# кратно 4, чтобы куски base64 декодировались независимо
+CHUNK_CHARS = 256 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024
+
 
 class Base64ImageField(serializers.ImageField):
+    """Картинка в base64 (data URL).
+
+    Размер строки проверяется до декодирования, формат и габариты - по
+    заголовку из первого куска. Строка декодируется кусками во временный
+    файл, некорректный кусок отклоняется целиком.
+    """
+    default_error_messages = {
+        'image_too_large': ('Размер картинки не должен превышать '
+                            '{max_size} Мб.'),
+        'image_format': 'Допустимые форматы картинки: {formats}.',
+        'image_dimensions': ('Ширина и высота картинки не должны превышать '
+                             '{max_dimension} пикселей.'),
+        'invalid_base64': 'Некорректная строка base64.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='image.' + ext)
+            _, separator, imgstr = data.partition(';base64,')
+            if not separator:
+                self.fail('invalid_base64')
+            data = self.decode(imgstr)
 
         return super().to_internal_value(data)
+
+    def decode(self, imgstr):
+        if len(imgstr) * 3 // 4 > MAX_IMAGE_SIZE:
+            self.fail('image_too_large',
+                      max_size=MAX_IMAGE_SIZE // (1024 * 1024))
+        image_file = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        extension = None
+        for start in range(0, len(imgstr), CHUNK_CHARS):
+            try:
+                image_file.write(base64.b64decode(
+                    imgstr[start:start + CHUNK_CHARS], validate=True))
+            except binascii.Error:
+                self.fail('invalid_base64')
+            if extension is None:
+                # формат и габариты - до декодирования остальных кусков
+                image_file.seek(0)
+                extension = self.check_header(image_file)
+                image_file.seek(0, io.SEEK_END)
+        if extension is None:
+            self.fail('invalid_base64')
+        image_file.seek(0)
+        return File(image_file, name='image.' + extension)
+
+    def check_header(self, image_file):
+        """Формат и габариты: Image.open читает только заголовок."""
+        try:
+            image = Image.open(image_file)
+        except (UnidentifiedImageError, OSError):
+            self.fail('invalid_image')
+        if image.format not in ALLOWED_IMAGE_FORMATS:
+            self.fail('image_format',
+                      formats=', '.join(ALLOWED_IMAGE_FORMATS))
+        if max(image.size) > MAX_IMAGE_DIMENSION:
+            self.fail('image_dimensions',
+                      max_dimension=MAX_IMAGE_DIMENSION)
+        return ALLOWED_IMAGE_FORMATS[image.format]
+
+
+class PrimaryKeyListField(serializers.ListField):
+    """Список первичных ключей: все объекты загружаются одним запросом.
+
+    В отличие от PrimaryKeyRelatedField(many=True), который делает запрос
+    на каждый ключ, сообщает сразу обо всех несуществующих ключах.
+    """
+    child = serializers.IntegerField(min_value=1)
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        pks = list(dict.fromkeys(super().to_internal_value(data)))
+        objects = resolve_pks(self.queryset, pks)
+        return [objects[pk] for pk in pks]
+
+    def to_representation(self, data):
+        return [item.pk for item in data.all()]
+
+
+def resolve_pks(queryset, pks):
+    """Объекты по списку ключей через in_bulk; ошибка со всеми пропусками."""
+    objects = queryset.in_bulk(pks)
+    missing = [str(pk) for pk in pks if pk not in objects]
+    if missing:
+        raise serializers.ValidationError(
+            f'Недопустимые первичные ключи {", ".join(missing)} - '
+            f'объекты не существуют.'
+        )
+    return objects
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Абсолютные ссылки на уменьшенные копии картинки рецепта."""
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        return {
+            size: {
+                image_format: request.build_absolute_uri(
+                    default_storage.url(name))
+                for image_format, name in formats.items()
+            }
+            for size, formats in value.items()
+        }
@@ -1,18 +1,95 @@
-from django_filters.rest_framework import (BooleanFilter, FilterSet,
-                                           ModelMultipleChoiceFilter)
+from django import forms
+from django.core.validators import validate_slug
+from django_filters.rest_framework import (BooleanFilter, CharFilter,
+                                           ChoiceFilter, Filter, FilterSet,
+                                           NumberFilter)
 
-from recipes.models import Recipe, Tag
+from recipes.models import Recipe, RecipePopularity
+from recipes.popularity import DEFAULT_PERIOD
+from recipes.search import search_recipes
+
+
+class SlugListField(forms.Field):
+    """Список slug из повторяющегося параметра (?tags=a&tags=b)."""
+    widget = forms.MultipleHiddenInput
+    default_validators = [validate_slug]
+
+    def to_python(self, value):
+        return [item for item in value or () if item]
+
+    def run_validators(self, value):
+        for item in value:
+            super().run_validators(item)
+
+
+class TagsFilter(Filter):
+    """Рецепты хотя бы с одним из тегов.
+
+    Slug сравниваются в самом запросе: без отдельной загрузки тегов для
+    проверки и без DISTINCT по строкам рецептов (semi-join).
+    """
+    field_class = SlugListField
+
+    def filter(self, queryset, value):
+        if not value:
+            return queryset
+        return queryset.filter(pk__in=Recipe.tags.through.objects.filter(
+            tag__slug__in=value).values('recipe'))
 
 
 class RecipeFilter(FilterSet):
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
-    )
-    is_favorited = BooleanFilter(field_name='is_favorited')
-    is_in_shopping_cart = BooleanFilter(field_name='is_in_shopping_cart')
+    tags = TagsFilter()
+    # по id, без загрузки автора для проверки (ModelChoiceFilter)
+    author = NumberFilter(field_name='author_id')
+    is_favorited = BooleanFilter(method='filter_is_favorited')
+    is_in_shopping_cart = BooleanFilter(method='filter_is_in_shopping_cart')
+    search = CharFilter(method='filter_search')
+    # period только уточняет ordering=popular и сам ничего не фильтрует
+    period = ChoiceFilter(choices=RecipePopularity.Period.choices,
+                          method='skip_filter')
+    ordering = ChoiceFilter(choices=(('popular', 'popular'),),
+                            method='filter_ordering')
 
     class Meta:
         model = Recipe
-        fields = ('author',)
+        fields = ('tags', 'author')
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_by_user(queryset, 'user_favorites', value)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_by_user(queryset, 'shoppingcart__user', value)
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию, тексту и ингредиентам.
+
+        Результаты упорядочены по релевантности, затем по новизне.
+        """
+        return search_recipes(queryset, value).order_by(
+            '-search_rank', '-created_ts', '-id')
+
+    def skip_filter(self, queryset, name, value):
+        return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка по заранее посчитанной оценке (update_popularity).
+
+        Рецепты без событий за период в выдачу не попадают.
+        """
+        period = self.form.cleaned_data.get('period') or DEFAULT_PERIOD
+        return queryset.filter(popularity__period=period).order_by(
+            '-popularity__score', '-popularity__recipe_id')
+
+    def filter_by_user(self, queryset, lookup, value):
+        """Фильтр через соединение с таблицей пользователя (semi-join).
+
+        Аннотации is_favorited / is_in_shopping_cart нужны только для
+        вывода; фильтрация по ним заставляет вычислять подзапрос на
+        каждой строке рецептов.
+        """
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        if value:
+            return queryset.filter(**{lookup: user})
+        return queryset.exclude(**{lookup: user})
@@ -0,0 +1,258 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# списки IN (%s, %s, ...) разной длины - один и тот же запрос
+IN_LIST_RE = re.compile(r'\((?:%s, )*%s\)')
+DUPLICATES_IN_LOG = 5
+
+
+def fingerprint(sql):
+    return IN_LIST_RE.sub('(...)', sql)
+
+
+class QueryRecorder:
+    """Обёртка connection.execute_wrapper: число, время и отпечатки SQL."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.installed = False
+
+    def install(self):
+        """Подключение к соединению текущего потока (контекстный менеджер).
+
+        Рекордер, который ни разу не подключали, ничего не видел: его
+        нули - не результат измерения.
+        """
+        self.installed = True
+        return connection.execute_wrapper(self)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        """Запросы, повторённые в пределах запроса, - признак N+1."""
+        return {sql: count for sql, count in self.fingerprints.items()
+                if count > 1}
+
+
+class ViewStats:
+    """Накопленные показатели по представлениям (в пределах процесса)."""
+    FIELDS = ('requests', 'queries', 'db_seconds', 'seconds',
+              'duplicate_queries', 'budget_exceeded')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+
+    def record(self, view, recorder, seconds, budget):
+        with self.lock:
+            stats = self.views[view]
+            stats['requests'] += 1
+            stats['queries'] += recorder.count
+            stats['db_seconds'] += recorder.duration
+            stats['seconds'] += seconds
+            stats['duplicate_queries'] += sum(
+                count - 1 for count in recorder.duplicates.values())
+            if budget is not None and recorder.count > budget:
+                stats['budget_exceeded'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {view: dict(stats) for view, stats in self.views.items()}
+
+
+view_stats = ViewStats()
+
+
+def resolve_view(view_func, method):
+    """Имя представления DRF вида RecipeViewSet.list и его бюджет запросов.
+
+    Бюджет задаётся атрибутом query_budget: числом или словарем
+    {действие: число}.
+    """
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}', None
+    actions = getattr(view_func, 'actions', None)
+    action = actions.get(method) if actions else method
+    budget = getattr(cls, 'query_budget', None)
+    if isinstance(budget, dict):
+        budget = budget.get(action)
+    return f'{cls.__name__}.{action}', budget
+
+
+class QueryInstrumentationMiddleware:
+    """Число и время SQL-запросов на каждый запрос к API.
+
+    Результат - заголовок Server-Timing, строка структурированного лога
+    (логгер api.instrumentation) и счётчики для /api/metrics/. Для
+    потоковых ответов запросы считаются до конца выдачи - в лог и
+    счётчики, а заголовок содержит только время до начала выдачи. Под
+    ASGI запросы считаются в потоке пула api.async_views (рекордер
+    передаётся в request); представления вне пула не учитываются.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            # так Django отличает асинхронный middleware
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.query_recorder = QueryRecorder()
+        started = time.perf_counter()
+        with request.query_recorder.install():
+            response = self.get_response(request)
+        return self.process(request, response, started)
+
+    async def __acall__(self, request):
+        request.query_recorder = QueryRecorder()
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        return self.process(request, response, started)
+
+    def process(self, request, response, started):
+        view = getattr(request, 'instrumented_view', None)
+        if view is None:
+            return response
+        recorder = request.query_recorder
+        # под ASGI запросы видны только представлениям из пула
+        # api.async_views; для остальных (админка) показателей нет
+        if not recorder.installed:
+            return response
+        name, budget = view
+        timing = f'app;dur={(time.perf_counter() - started) * 1000:.1f}'
+        if response.streaming:
+            # запросы при выдаче ещё впереди - неполное число не отдаём
+            response['Server-Timing'] = timing
+            args = (request, response, recorder, started, name, budget)
+            if hasattr(response, 'async_streaming_content'):
+                response.async_streaming_content = self.astream(
+                    response.async_streaming_content, *args)
+            else:
+                response.streaming_content = self.stream(
+                    response.streaming_content, *args)
+        else:
+            response['Server-Timing'] = (
+                f'db;dur={recorder.duration * 1000:.1f};'
+                f'desc="{recorder.count} queries", {timing}'
+            )
+            self.finish(request, response, recorder, started, name, budget)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.instrumented_view = resolve_view(
+            view_func, request.method.lower())
+
+    def stream(self, content, request, response, recorder, started, name,
+               budget):
+        with recorder.install():
+            yield from content
+        self.finish(request, response, recorder, started, name, budget)
+
+    async def astream(self, content, request, response, recorder, started,
+                      name, budget):
+        # запросы считает поток пула, читающий ответ (api.async_views)
+        try:
+            async for part in content:
+                yield part
+        finally:
+            await content.aclose()
+        self.finish(request, response, recorder, started, name, budget)
+
+    def finish(self, request, response, recorder, started, name, budget):
+        seconds = time.perf_counter() - started
+        view_stats.record(name, recorder, seconds, budget)
+        duplicates = sorted(recorder.duplicates.items(),
+                            key=lambda item: -item[1])[:DUPLICATES_IN_LOG]
+        over_budget = budget is not None and recorder.count > budget
+        logger.log(
+            logging.WARNING if over_budget else logging.INFO,
+            json.dumps({
+                'view': name,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': recorder.count,
+                'db_ms': round(recorder.duration * 1000, 1),
+                'total_ms': round(seconds * 1000, 1),
+                'query_budget': budget,
+                'duplicates': [{'sql': sql, 'count': count}
+                               for sql, count in duplicates],
+            }, ensure_ascii=False)
+        )
+
+
+def render_metrics(extra=()):
+    """Показатели в текстовом формате Prometheus.
+
+    extra - дополнительные строки (например, счётчики кэша токенов).
+    """
+    metrics = (
+        ('requests', 'foodgram_requests_total', 'Запросы к API'),
+        ('queries', 'foodgram_db_queries_total', 'SQL-запросы'),
+        ('db_seconds', 'foodgram_db_seconds_total', 'Время SQL-запросов'),
+        ('seconds', 'foodgram_request_seconds_total', 'Время обработки'),
+        ('duplicate_queries', 'foodgram_duplicate_queries_total',
+         'Повторы одинаковых SQL-запросов'),
+        ('budget_exceeded', 'foodgram_query_budget_exceeded_total',
+         'Превышения бюджета запросов'),
+    )
+    snapshot = view_stats.snapshot()
+    lines = []
+    for field, metric, description in metrics:
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} counter')
+        for view, stats in sorted(snapshot.items()):
+            lines.append(f'{metric}{{view="{view}"}} {stats[field]}')
+    lines.extend(extra)
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def query_budget(view, action=None):
+    """Проверка бюджета запросов, объявленного у представления.
+
+    Для тестов и бенчмарков:
+
+        with query_budget(RecipeViewSet, 'list'):
+            client.get('/api/recipes/')
+
+    AssertionError со списком запросов, если их больше бюджета.
+    """
+    budget = view.query_budget
+    if isinstance(budget, dict):
+        budget = budget[action]
+    recorder = QueryRecorder()
+    with recorder.install():
+        yield recorder
+    if recorder.count > budget:
+        queries = '\n'.join(
+            f'{count} x {sql}' for sql, count in
+            recorder.fingerprints.most_common())
+        raise AssertionError(
+            f'{view.__name__}.{action}: {recorder.count} запросов при '
+            f'бюджете {budget}:\n{queries}')
@@ -0,0 +1,67 @@
+import json
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.cache import get_version
+
+
+def strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+class CachedReferenceMixin:
+    """Кэширование ответов list / retrieve для справочников.
+
+    Сериализованные данные хранятся под ключом с версией справочника,
+    версию меняют сигналы post_save / post_delete (recipes.signals).
+    Если ETag совпал с одним из If-None-Match, отдаётся 304 без обращения
+    к БД.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_cache_key(self, request):
+        label = self.queryset.model._meta.label_lower
+        path = sha1(request.get_full_path().encode()).hexdigest()
+        return f'reference:{label}:{get_version(label)}:{path}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        cache_key = self.get_cache_key(request)
+        cached = cache.get(cache_key)
+        if cached is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            content = json.dumps(response.data, sort_keys=True)
+            etag = '"{}"'.format(sha1(content.encode()).hexdigest())
+            cached = (etag, response.data)
+            cache.set(cache_key, cached, settings.REFERENCE_CACHE_TIMEOUT)
+
+        etag, data = cached
+        if self.etag_matches(etag, request.headers.get('If-None-Match')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    @staticmethod
+    def etag_matches(etag, if_none_match):
+        """Слабое сравнение (RFC 7232, 3.2): префикс W/ не учитывается."""
+        if not if_none_match:
+            return False
+        etags = parse_etags(if_none_match)
+        if etags == ['*']:
+            return True
+        return strip_weak(etag) in {strip_weak(tag) for tag in etags}
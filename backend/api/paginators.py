@@ -1,7 +1,61 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import b64decode, b64encode
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .services import get_limit
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 50
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset-пагинация ленты рецептов: без OFFSET и без COUNT(*)."""
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 50
+    ordering = ('-created_ts', '-id')
+
+
+class FeedPagination(BasePagination):
+    """Keyset-пагинация ленты подписок.
+
+    Курсор - (created_ts, id) последнего рецепта страницы; страница
+    строится слиянием нескольких источников (recipes.feed.get_feed),
+    поэтому обычные пагинаторы queryset здесь не подходят.
+    """
+    page_size = 6
+    max_page_size = 50
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        return get_limit(request, self.page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            decoded = b64decode(encoded.encode('ascii')).decode('ascii')
+            created_ts, pk = decoded.split('|')
+            return datetime.fromisoformat(created_ts), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, request, key):
+        created_ts, pk = key
+        encoded = b64encode(
+            f'{created_ts.isoformat()}|{pk}'.encode('ascii')).decode('ascii')
+        return replace_query_param(request.build_absolute_uri(),
+                                   self.cursor_query_param, encoded)
+
+    def get_paginated_response(self, data, next_link=None):
+        return Response({'next': next_link, 'results': data})
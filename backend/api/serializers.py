@@ -1,15 +1,40 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from djoser.serializers import UserSerializer
 from rest_framework import serializers
 
+from recipes.images import schedule_variants, schedule_variants_cleanup
 from recipes.models import Ingredient, IngredientInRecipe
-from recipes.models import Recipe, ShoppingCart, Tag
+from recipes.models import Recipe, Tag, ingredient_lines_prefetch
+from recipes.search import update_search_index
 from users.models import Follow
-from .fields import Base64ImageField
+from .fields import (Base64ImageField, ImageVariantsField,
+                     PrimaryKeyListField, resolve_pks)
+from .services import MAX_BATCH_SIZE, get_recipes_limit
 
 User = get_user_model()
 
 
+def set_prefetched(instance, **related_objects):
+    """Заполнение кэша prefetch_related уже загруженными объектами.
+
+    Так же поступает сам Django в prefetch_related_objects: последующие
+    instance.<relation>.all() не обращаются к БД.
+    """
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    for name, objects in related_objects.items():
+        manager = getattr(instance, name)
+        cache_name = getattr(manager, 'prefetch_cache_name', None)
+        if cache_name is None:
+            cache_name = manager.field.remote_field.get_cache_name()
+        queryset = manager.get_queryset()
+        queryset._result_cache = list(objects)
+        queryset._prefetch_done = True
+        instance._prefetched_objects_cache[cache_name] = queryset
+
+
 class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
@@ -19,6 +44,8 @@ class CustomUserSerializer(UserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if not request.user.is_authenticated:
             return False
@@ -26,9 +53,11 @@ class CustomUserSerializer(UserSerializer):
 
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class CustomUserExtendedSerializer(CustomUserSerializer):
@@ -42,19 +71,19 @@ class CustomUserExtendedSerializer(CustomUserSerializer):
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit:
-            recipes_limit = int(recipes_limit)
-        recipe_qs = obj.author_recipes.all()[:recipes_limit]
+        # для страницы подписок рецепты загружены заранее (SubscriptionList)
+        recipes = getattr(obj, 'latest_recipes', None)
+        if recipes is None:
+            recipes = obj.author_recipes.all()[:get_recipes_limit(request)]
         serializer = RecipeMinifiedSerializer(
-            recipe_qs,
+            recipes,
             many=True,
             context={'request': request}
         )
         return serializer.data
 
     def get_recipes_count(self, obj):
-        return obj.author_recipes.count()
+        return obj.recipes_count
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -92,16 +121,39 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         source='ingredientinrecipe_set',
         many=True
     )
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'text', 'image', 'cooking_time',
+        fields = ('id', 'name', 'text', 'image', 'image_variants',
+                  'cooking_time',
                   'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart')
 
+    def to_representation(self, obj):
+        # подписка на автора уже посчитана в queryset (for_listing)
+        if hasattr(obj, 'author_is_subscribed'):
+            obj.author.is_subscribed = obj.author_is_subscribed
+        return super().to_representation(obj)
+
+
+class RecipeMatchSerializer(RecipeReadSerializer):
+    """Рецепт с оценкой совпадения по имеющимся ингредиентам."""
+    matched = serializers.IntegerField(source='matched_count')
+    missing = serializers.SerializerMethodField()
+    coverage = serializers.FloatField()
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + (
+            'matched', 'missing', 'coverage')
+
+    def get_missing(self, obj):
+        return max(obj.ingredients_count - obj.matched_count, 0)
+
 
 class IngredientInRecipeAddSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    # ингредиенты всех строк загружаются разом в RecipeWriteSerializer
+    id = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = IngredientInRecipe
@@ -118,9 +170,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     author = serializers.SlugRelatedField(
         read_only=True, slug_field='username'
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True
-    )
+    tags = PrimaryKeyListField(queryset=Tag.objects.all())
     image = Base64ImageField()
     ingredients = IngredientInRecipeAddSerializer(many=True)
 
@@ -130,13 +180,20 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                   'tags', 'ingredients')
 
     def validate(self, data):
-        ingredients = data['ingredients']
+        ingredients = data.get('ingredients', [])
         used_ingredients = set([item['id'] for item in ingredients])
         if len(ingredients) > len(used_ingredients):
             err_msg = 'Ингредиенты в рецепте не должны повторяться.'
             raise serializers.ValidationError(err_msg)
         return data
 
+    def validate_ingredients(self, value):
+        ingredients = resolve_pks(
+            Ingredient.objects.all(), [item['id'] for item in value])
+        for item in value:
+            item['id'] = ingredients[item['id']]
+        return value
+
     def validate_cooking_time(self, value):
         if value < 1:
             err_msg = 'Убедитесь, что это значение больше либо равно 1!'
@@ -153,35 +210,154 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             )
             recipe_ingredients_to_create.append(new_item)
         IngredientInRecipe.objects.bulk_create(recipe_ingredients_to_create)
+        return recipe_ingredients_to_create
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        current_recipe = Recipe.objects.create(**validated_data)
-        current_recipe.tags.add(*tags)
-        self.create_ingredients_in_recipe(current_recipe, ingredients)
+        current_recipe = Recipe.objects.create(
+            ingredients_count=len(ingredients), **validated_data)
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=current_recipe, tag=tag)
+            for tag in tags
+        )
+        lines = self.create_ingredients_in_recipe(current_recipe, ingredients)
+        self.loaded_relations = {
+            'tags': tags, 'ingredientinrecipe_set': lines
+        }
+        update_search_index([current_recipe.pk])
+        schedule_variants(current_recipe)
         return current_recipe
 
+    def update_tags(self, recipe, tags):
+        """Изменение тегов рецепта: только добавленные и удалённые."""
+        through = Recipe.tags.through
+        current_ids = set(
+            through.objects.filter(recipe=recipe).values_list(
+                'tag_id', flat=True)
+        )
+        new_ids = {tag.id for tag in tags}
+        if current_ids - new_ids:
+            through.objects.filter(
+                recipe=recipe, tag_id__in=current_ids - new_ids).delete()
+        through.objects.bulk_create(
+            through(recipe=recipe, tag_id=tag_id)
+            for tag_id in new_ids - current_ids
+        )
+        self.loaded_relations['tags'] = tags
+
+    def update_ingredients(self, recipe, ingredients):
+        """Изменение состава рецепта по разнице с текущими строками.
+
+        Неизменённые строки не трогаем, у изменённых обновляем количество.
+        Возвращает True, если изменился список ингредиентов.
+        """
+        current = {
+            line.ingredient_id: line
+            for line in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        incoming = {item['id'].id: item for item in ingredients}
+        removed_ids = current.keys() - incoming.keys()
+        if removed_ids:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed_ids).delete()
+
+        lines, lines_to_create, lines_to_update = [], [], []
+        for ingredient_id, item in incoming.items():
+            line = current.get(ingredient_id)
+            if line is None:
+                line = IngredientInRecipe(recipe=recipe, amount=item['amount'])
+                lines_to_create.append(line)
+            elif line.amount != item['amount']:
+                line.amount = item['amount']
+                lines_to_update.append(line)
+            line.ingredient = item['id']
+            lines.append(line)
+        IngredientInRecipe.objects.bulk_create(lines_to_create)
+        IngredientInRecipe.objects.bulk_update(lines_to_update, ['amount'])
+        self.loaded_relations['ingredientinrecipe_set'] = lines
+        return bool(removed_ids or lines_to_create)
+
+    @transaction.atomic
     def update(self, obj, validated_data):
+        # уже загруженные связи рецепта - для ответа без повторных запросов
+        self.loaded_relations = {}
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredients', [])
+        # ингредиенты не повторяются (validate), их число известно заранее
+        if ingredients and len(ingredients) != obj.ingredients_count:
+            validated_data['ingredients_count'] = len(ingredients)
+        # копии старой картинки больше не нужны, новые создаст пул
+        old_variants = {}
+        if 'image' in validated_data:
+            old_variants = obj.image_variants
+            validated_data['image_variants'] = {}
         for key, value in validated_data.items():
             setattr(obj, key, value)
+        # только изменённые поля: счётчики меняются параллельно через F()
+        if validated_data:
+            obj.save(update_fields=validated_data.keys())
         if tags:
-            obj.tags.clear()
-            obj.tags.add(*tags)
-        if ingredients:
-            obj.ingredients.clear()
-            self.create_ingredients_in_recipe(obj, ingredients)
-        # save() обязателен - могут быть изменены атрибуты рецепта, напр. имя
-        obj.save()
+            self.update_tags(obj, tags)
+        # количества в поисковый индекс не входят
+        ingredients_changed = bool(ingredients) and self.update_ingredients(
+            obj, ingredients)
+        if ingredients_changed or {'name', 'text'} & validated_data.keys():
+            update_search_index([obj.pk])
+        if 'image' in validated_data:
+            schedule_variants_cleanup(old_variants)
+            schedule_variants(obj)
         return obj
 
     def to_representation(self, obj):
+        """Ответ строится из объектов, загруженных при записи.
+
+        Новый рецепт ещё не может быть в избранном или в корзине, а при
+        обновлении эти флаги уже посчитаны в queryset (with_annotations).
+        Автор - текущий пользователь, подписаться на себя нельзя.
+        """
         request = self.context.get('request')
         user = request.user
-        cart_qs = ShoppingCart.objects.filter(recipe=obj, user=user)
-        obj.is_favorited = obj.user_favorites.filter(id=user.id).exists()
-        obj.is_in_shopping_cart = cart_qs.exists()
+        if not hasattr(obj, 'is_favorited'):
+            obj.is_favorited = False
+            obj.is_in_shopping_cart = False
+        if obj.author_id == user.id:
+            obj.author = user
+            obj.author_is_subscribed = False
+
+        # UpdateModelMixin сбрасывает кэш prefetch после сохранения
+        loaded = getattr(self, 'loaded_relations', {})
+        if 'tags' in loaded:
+            loaded['tags'] = sorted(loaded['tags'], key=lambda tag: tag.name)
+        set_prefetched(obj, **loaded)
+        lookups = {'tags': 'tags',
+                   'ingredientinrecipe_set': ingredient_lines_prefetch()}
+        missing = [lookup for name, lookup in lookups.items()
+                   if name not in loaded]
+        if missing:
+            prefetch_related_objects([obj], *missing)
         serializer = RecipeReadSerializer(obj, context={'request': request})
         return serializer.data
+
+
+class BatchSerializer(serializers.Serializer):
+    """Списки id для пакетного добавления и удаления."""
+    add = serializers.ListField(child=serializers.IntegerField(min_value=1),
+                                max_length=MAX_BATCH_SIZE, default=list)
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=MAX_BATCH_SIZE, default=list)
+
+    def validate(self, data):
+        add = list(dict.fromkeys(data['add']))
+        remove = list(dict.fromkeys(data['remove']))
+        if not add and not remove:
+            raise serializers.ValidationError(
+                'Нужно указать хотя бы один id в add или remove.')
+        both = set(add) & set(remove)
+        if both:
+            raise serializers.ValidationError(
+                f'id {", ".join(map(str, sorted(both)))} указаны '
+                f'одновременно в add и remove.')
+        return {'add': add, 'remove': remove}
@@ -1,47 +1,170 @@
+from django.contrib.auth import get_user_model
+from django.db import connections, router
 from rest_framework.serializers import ValidationError
 
-from recipes.models import ShoppingCart
+from recipes.models import ShoppingCart, count_by
 from users.models import Follow
 
+Favorite = get_user_model().favorites.through
 
-def check_favorites(user, recipe, method):
-    """Проверка наличие рецепта в избранном."""
-    already_in_favorites = user.favorites.filter(id=recipe.id).exists()
+MAX_BATCH_SIZE = 100
+MAX_MATCH_INGREDIENTS = 50
 
-    if method == 'POST' and already_in_favorites:
+MAX_RECIPES_LIMIT = 10
+
+
+def insert_ignore(model, fields, rows):
+    """Вставка строк одним INSERT ... ON CONFLICT DO NOTHING.
+
+    Возвращает число реально добавленных строк: дубликаты пропускает
+    сама БД, без предварительной проверки и без IntegrityError.
+    """
+    connection = connections[router.db_for_write(model)]
+    ops = connection.ops
+    columns = ', '.join(
+        ops.quote_name(model._meta.get_field(field).column)
+        for field in fields
+    )
+    values = ', '.join(
+        '(' + ', '.join(['%s'] * len(fields)) + ')' for _ in rows)
+    sql = (f'{ops.insert_statement(ignore_conflicts=True)} '
+           f'{ops.quote_name(model._meta.db_table)} ({columns}) '
+           f'VALUES {values} '
+           f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+        return cursor.rowcount
+
+
+def add_to_favorites(user, recipe):
+    """Добавление рецепта в избранное."""
+    if not insert_ignore(Favorite, ('user', 'recipe'),
+                         [(user.pk, recipe.pk)]):
         err_msg = 'Такой рецепт уже есть в избранном.'
         raise ValidationError({'errors:': err_msg})
 
-    if method == 'DELETE' and not already_in_favorites:
+
+def remove_from_favorites(user, recipe):
+    """Удаление рецепта из избранного."""
+    deleted, _ = Favorite.objects.filter(user=user, recipe=recipe).delete()
+    if not deleted:
         err_msg = 'Такого рецепта не было в избранном.'
         raise ValidationError({'errors:': err_msg})
 
 
-def check_shopping_cart(user, recipe, method):
-    """Проверка наличия рецепта в корзине."""
-    already_in_cart = ShoppingCart.objects.filter(user=user, recipe=recipe)
-
-    if method == 'POST' and already_in_cart:
+def add_to_shopping_cart(user, recipe):
+    """Добавление рецепта в корзину."""
+    if not insert_ignore(ShoppingCart, ('user', 'recipe'),
+                         [(user.pk, recipe.pk)]):
         err_msg = 'Такой рецепт уже есть в списке покупок.'
         raise ValidationError({'errors:': err_msg})
 
-    if method == 'DELETE' and not already_in_cart:
+
+def remove_from_shopping_cart(user, recipe):
+    """Удаление рецепта из корзины."""
+    deleted, _ = ShoppingCart.objects.filter(
+        user=user, recipe=recipe).delete()
+    if not deleted:
         err_msg = 'Такого рецепта не было в списке покупок.'
         raise ValidationError({'errors:': err_msg})
 
 
-def check_subscriptions(user, author, method):
-    """Проверка наличия подписки и предотвращение подписки на самого себя."""
-    is_subscribed = Follow.objects.filter(user=user, author=author).exists()
-
-    if author == user and method == 'POST':
+def subscribe(user, author):
+    """Подписка с запретом подписки на самого себя."""
+    if author == user:
         err_msg = 'Невозможно подписаться на самого себя.'
         raise ValidationError({'errors': err_msg})
-
-    if is_subscribed and method == 'POST':
+    if not insert_ignore(Follow, ('user', 'author'), [(user.pk, author.pk)]):
         err_msg = 'Такая подписка уже существует.'
         raise ValidationError({'errors': err_msg})
 
-    if not is_subscribed and method == 'DELETE':
+
+def unsubscribe(user, author):
+    """Отмена подписки."""
+    deleted, _ = Follow.objects.filter(user=user, author=author).delete()
+    if not deleted:
         err_msg = 'Такой подписки не существует.'
         raise ValidationError({'errors': err_msg})
+
+
+def apply_batch(user, model, field, targets, add_ids, remove_ids):
+    """Пакетное добавление / удаление связей пользователя с объектами.
+
+    model - таблица связей, field - её поле со ссылкой на объект, targets -
+    queryset допустимых объектов. Изменения вносятся одним INSERT и одним
+    DELETE; возвращаются статусы по каждому id и id изменённых объектов.
+    """
+    ids = [*add_ids, *remove_ids]
+    found = set(targets.filter(pk__in=ids).values_list('pk', flat=True))
+    linked = set(model.objects.filter(
+        user=user, **{f'{field}__in': ids}).values_list(field, flat=True))
+
+    results = {'add': [], 'remove': []}
+    to_add, to_remove = [], []
+    for pk in add_ids:
+        if pk not in found:
+            result = 'not_found'
+        elif pk in linked:
+            result = 'already_exists'
+        else:
+            result = 'added'
+            to_add.append(pk)
+        results['add'].append({'id': pk, 'status': result})
+    for pk in remove_ids:
+        if pk not in found:
+            result = 'not_found'
+        elif pk not in linked:
+            result = 'not_exists'
+        else:
+            result = 'removed'
+            to_remove.append(pk)
+        results['remove'].append({'id': pk, 'status': result})
+
+    if to_add:
+        insert_ignore(model, ('user', field),
+                      [(user.pk, pk) for pk in to_add])
+    if to_remove:
+        model.objects.filter(
+            user=user, **{f'{field}__in': to_remove}).delete()
+    return results, to_add + to_remove
+
+
+def recount_counter(model, pks, field, related, related_field):
+    """Точный пересчёт счётчика для нескольких записей одним UPDATE."""
+    if pks:
+        model.objects.filter(pk__in=pks).update(
+            **{field: count_by(related.objects, related_field)})
+
+
+def get_recipes_limit(request):
+    """Проверка параметра recipes_limit и ограничение его сверху."""
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None:
+        return MAX_RECIPES_LIMIT
+    if not recipes_limit.isdigit():
+        err_msg = 'recipes_limit должен быть неотрицательным целым числом.'
+        raise ValidationError({'recipes_limit': err_msg})
+    return min(int(recipes_limit), MAX_RECIPES_LIMIT)
+
+
+def get_ingredient_ids(request):
+    """Список id ингредиентов из параметра ingredients=1,2,3."""
+    ingredients = request.query_params.get('ingredients', '')
+    ids = [item.strip() for item in ingredients.split(',') if item.strip()]
+    if not ids or not all(item.isdigit() for item in ids):
+        err_msg = 'Укажите id ингредиентов через запятую.'
+        raise ValidationError({'ingredients': err_msg})
+    ids = list(dict.fromkeys(int(item) for item in ids))
+    if len(ids) > MAX_MATCH_INGREDIENTS:
+        err_msg = f'Не больше {MAX_MATCH_INGREDIENTS} ингредиентов.'
+        raise ValidationError({'ingredients': err_msg})
+    return ids
+
+
+def get_limit(request, default, maximum):
+    """Параметр limit в пределах от 1 до maximum."""
+    try:
+        limit = int(request.query_params.get('limit', default))
+    except ValueError:
+        raise ValidationError({'errors': 'limit должен быть числом.'})
+    return min(max(limit, 1), maximum)
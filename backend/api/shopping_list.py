@@ -0,0 +1,81 @@
+import csv
+import json
+
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+
+from recipes.models import IngredientInRecipe, ShoppingCart
+
+CHUNK_SIZE = 500
+TITLE = 'Перечень ингредиентов для рецептов из списка покупок:\n'
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи."""
+    def write(self, value):
+        return value
+
+
+def cart_ingredients(user):
+    """Суммарное количество ингредиентов в корзине - один запрос с GROUP BY."""
+    cart = ShoppingCart.objects.filter(user=user).values('recipe')
+    return IngredientInRecipe.objects.filter(
+        recipe__in=cart
+    ).values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        total=Sum('amount')
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def get_cart_ingredients(user):
+    """Строки списка покупок через серверный курсор (iterator) порциями."""
+    return cart_ingredients(user).iterator(chunk_size=CHUNK_SIZE)
+
+
+def render_txt(rows):
+    yield TITLE
+    for i, row in enumerate(rows, 1):
+        name = row['ingredient__name']
+        unit = row['ingredient__measurement_unit']
+        yield f'{i}) {name} ({unit}): {row["total"]}\n'
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow((row['ingredient__name'],
+                               row['ingredient__measurement_unit'],
+                               row['total']))
+
+
+def render_json(rows):
+    yield '['
+    for i, row in enumerate(rows):
+        item = {
+            'name': row['ingredient__name'],
+            'measurement_unit': row['ingredient__measurement_unit'],
+            'amount': row['total'],
+        }
+        separator = ',' if i else ''
+        yield separator + json.dumps(item, ensure_ascii=False)
+    yield ']'
+
+
+FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json; charset=utf-8'),
+}
+
+
+def shopping_list_response(user, file_format='txt'):
+    """Потоковая выгрузка списка покупок в формате txt, csv или json."""
+    render, content_type = FORMATS[file_format]
+    response = StreamingHttpResponse(
+        render(get_cart_ingredients(user)), content_type=content_type
+    )
+    filename = f'to_buy.{file_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    # вход обновляет только last_login, которого нет в кэше
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+            'key', flat=True):
+        invalidate_token(key)
@@ -0,0 +1,500 @@
+import base64
+import io
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from recipes.feed import backfill_feed
+from recipes.images import build_variants
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from .asgi import ASGIHandler
+from .authentication import USER_FIELDS, token_cache_key
+from .async_views import STREAM_BUFFER, async_view
+from .fields import CHUNK_CHARS, Base64ImageField
+from .instrumentation import query_budget
+from .views import (Feed, IngredientViewSet, RecipeViewSet, Subscription,
+                    SubscriptionList, TagViewSet)
+
+User = get_user_model()
+
+RECIPES = 80
+TAGS_PER_RECIPE = 2
+INGREDIENTS_PER_RECIPE = 3
+# поисковый индекс рецепта: один UPDATE в PostgreSQL, четыре запроса
+# в запасном варианте (recipes.search)
+SEARCH_INDEX_QUERIES = 1 if connection.vendor == 'postgresql' else 4
+
+
+def create_user(username):
+    return User.objects.create(
+        username=username, email=f'{username}@example.com',
+        first_name=username, last_name=username)
+
+
+def get_references():
+    """Теги и ингредиенты, загруженные миграциями."""
+    return list(Tag.objects.all()), list(Ingredient.objects.all()[:10])
+
+
+def create_recipes(authors, tags, ingredients, count):
+    """count рецептов с тегами и ингредиентами - поровну у каждого автора."""
+    Recipe.objects.bulk_create(
+        Recipe(author=authors[i % len(authors)], name=f'Рецепт {i}',
+               text='Текст', image='recipes/images/test.png',
+               cooking_time=10, ingredients_count=INGREDIENTS_PER_RECIPE)
+        for i in range(count))
+    # bulk_create заполняет pk не на всех БД (SQLite)
+    recipes = list(Recipe.objects.order_by('pk')[:count])
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe=recipe, tag=tags[(i + shift) % len(tags)])
+        for i, recipe in enumerate(recipes)
+        for shift in range(TAGS_PER_RECIPE))
+    IngredientInRecipe.objects.bulk_create(
+        IngredientInRecipe(
+            recipe=recipe, amount=10,
+            ingredient=ingredients[(i + shift) % len(ingredients)])
+        for i, recipe in enumerate(recipes)
+        for shift in range(INGREDIENTS_PER_RECIPE))
+    return recipes
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        authors = [create_user(f'author{i}') for i in range(3)]
+        cls.tags, cls.ingredients = get_references()
+        recipes = create_recipes(authors, cls.tags, cls.ingredients, RECIPES)
+        cls.user.favorites.add(*recipes[:5])
+        cls.user.follower.create(author=authors[0])
+
+    def assertListQueries(self, num, **params):
+        for limit in (6, 50):
+            with self.subTest(limit=limit), self.assertNumQueries(num):
+                response = self.client.get(
+                    '/api/recipes/', {'limit': limit, **params})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        # COUNT, страница рецептов, теги, строки состава
+        self.assertListQueries(4)
+
+    def test_authenticated(self):
+        # избранное, корзина и подписка - подзапросы в запросе страницы
+        self.client.force_authenticate(self.user)
+        self.assertListQueries(4)
+
+    def test_filtered_by_tags(self):
+        # теги сравниваются по slug в запросе страницы, без загрузки тегов
+        self.assertListQueries(4, tags=[tag.slug for tag in self.tags[:2]])
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return f'data:image/png;base64,{encoded}'
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeWriteQueriesTest(APITestCase):
+    """Число запросов при записи рецепта.
+
+    Тест идёт внутри транзакции, поэтому transaction.atomic добавляет
+    по паре SAVEPOINT / RELEASE SAVEPOINT.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags, cls.ingredients = get_references()
+        cls.recipe = create_recipes(
+            [cls.author], cls.tags, cls.ingredients, 1)[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def payload(self, tags, ingredients):
+        return {
+            'name': 'Новый рецепт', 'text': 'Текст', 'cooking_time': 15,
+            'image': make_image(),
+            'tags': [tag.pk for tag in tags],
+            'ingredients': [{'id': ingredient.pk, 'amount': 5}
+                            for ingredient in ingredients],
+        }
+
+    def test_create(self):
+        data = self.payload(self.tags[:2], self.ingredients[:5])
+        # теги, ингредиенты, рецепт и его связи, счётчик автора; рассылка
+        # по лентам идёт после фиксации транзакции
+        with self.assertNumQueries(10 + SEARCH_INDEX_QUERIES), \
+                query_budget(RecipeViewSet, 'create'):
+            response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_partial_update(self):
+        data = self.payload(self.tags[1:], self.ingredients[1:4])
+        del data['image']
+        # рецепт, теги, ингредиенты, поля рецепта, разница тегов (3) и
+        # состава (4)
+        with self.assertNumQueries(13 + SEARCH_INDEX_QUERIES), \
+                query_budget(RecipeViewSet, 'partial_update'):
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.pk}/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_partial_update_without_changes(self):
+        data = {
+            'tags': [tag.pk for tag in self.recipe.tags.all()],
+            'ingredients': [
+                {'id': line.ingredient_id, 'amount': line.amount}
+                for line in self.recipe.ingredientinrecipe_set.all()],
+        }
+        # только чтение: рецепт, теги, ингредиенты и текущие связи
+        with self.assertNumQueries(7):
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.pk}/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_destroy(self):
+        # рецепт, каскадное удаление связей (10), рецепт и счётчик автора
+        with self.assertNumQueries(13), \
+                query_budget(RecipeViewSet, 'destroy'):
+            response = self.client.delete(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeImageTest(APITestCase):
+    """Проверка картинки и уменьшенные копии.
+
+    Пул потоков подменён: копии строятся в тесте синхронно.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags, cls.ingredients = get_references()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+        patcher = mock.patch('recipes.images.executor')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_recipe(self, image):
+        data = {
+            'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 15,
+            'image': image, 'tags': [self.tags[0].pk],
+            'ingredients': [{'id': self.ingredients[0].pk, 'amount': 5}],
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/recipes/', data, format='json')
+
+    def variant_names(self, recipe):
+        return [name for formats in recipe.image_variants.values()
+                for name in formats.values()]
+
+    def assertImageError(self, image, message):
+        response = self.create_recipe(image)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data['image'],
+            [Base64ImageField().error_messages[message]])
+
+    def test_invalid_image(self):
+        text = base64.b64encode(b'not an image' * 100).decode('ascii')
+        for image, message in (
+                (f'data:image/png;base64,{text}', 'invalid_image'),
+                ('data:image/png;base64,!!!!', 'invalid_base64'),
+                ('data:image/png,iVBORw0KGgo=', 'invalid_base64')):
+            with self.subTest(image=image[:30]):
+                self.assertImageError(image, message)
+
+    def test_chunks(self):
+        # картинка из шума не сжимается: строка длиннее нескольких кусков
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (600, 600), os.urandom(600 * 600 * 3)).save(
+            buffer, format='PNG')
+        encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+        self.assertGreater(len(encoded), 2 * CHUNK_CHARS)
+        broken_tail = encoded[:-4] + '!!!!'
+        self.assertImageError(
+            f'data:image/png;base64,{broken_tail}', 'invalid_base64')
+        # заголовок проверяется раньше, чем декодируется испорченный хвост
+        text = base64.b64encode(b'text' * CHUNK_CHARS).decode('ascii')
+        self.assertImageError(
+            f'data:image/png;base64,{text[:-4]}!!!!', 'invalid_image')
+        response = self.create_recipe(f'data:image/png;base64,{encoded}')
+        self.assertEqual(response.status_code, 201)
+
+    def test_variants_are_deleted_with_old_image(self):
+        response = self.create_recipe(make_image())
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        # в фоне после сохранения; соединение теста остаётся открытым
+        build_variants(recipe.pk)
+        recipe.refresh_from_db()
+        old_variants = self.variant_names(recipe)
+        self.assertTrue(old_variants)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.pk}/', {'image': make_image()},
+                format='json')
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants, {})
+        for name in old_variants:
+            self.assertFalse(default_storage.exists(name))
+
+        build_variants(recipe.pk)
+        recipe.refresh_from_db()
+        new_variants = self.variant_names(recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        for name in new_variants:
+            self.assertFalse(default_storage.exists(name))
+
+
+class ReferenceCacheTest(APITestCase):
+    """Условные запросы к справочникам (If-None-Match)."""
+
+    def test_if_none_match(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        cases = {
+            etag: 304,
+            f'W/{etag}': 304,
+            f'"other", {etag}': 304,
+            '*': 304,
+            '"other"': 200,
+            etag[:-2] + '"': 200,
+            'garbage': 200,
+        }
+        for header, status in cases.items():
+            with self.subTest(header=header):
+                response = self.client.get(
+                    '/api/tags/', HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response['ETag'], etag)
+
+
+class QueryBudgetTest(APITestCase):
+    """Основные представления укладываются в объявленный query_budget.
+
+    Бюджеты учитывают промах кэша токенов, поэтому запросы идут с
+    настоящим токеном, а не через force_authenticate.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.authors = [create_user(f'author{i}') for i in range(3)]
+        cls.tags, cls.ingredients = get_references()
+        cls.recipes = create_recipes(
+            cls.authors, cls.tags, cls.ingredients, RECIPES)
+        cls.user.favorites.add(*cls.recipes[:5])
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe)
+            for recipe in cls.recipes[:3])
+        for author in cls.authors[:2]:
+            cls.user.follower.create(author=author)
+        backfill_feed(cls.user, cls.authors[:2])
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def get(self, view, action, path, **params):
+        # худший случай: промах кэша токенов и справочников
+        cache.clear()
+        with query_budget(view, action):
+            response = self.client.get(path, params)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_recipe_list(self):
+        for params in ({}, {'is_favorited': 1}, {'is_in_shopping_cart': 1},
+                       {'author': self.authors[0].pk},
+                       {'tags': [tag.slug for tag in self.tags]},
+                       {'search': 'рецепт'}, {'pagination': 'cursor'}):
+            with self.subTest(**params):
+                self.get(RecipeViewSet, 'list', '/api/recipes/', **params)
+
+    def test_popular(self):
+        for period in ('hot', 'trending', 'steady', 'all'):
+            with self.subTest(period=period):
+                self.get(RecipeViewSet, 'list', '/api/recipes/',
+                         ordering='popular', period=period)
+        response = self.client.get(
+            '/api/recipes/', {'ordering': 'popular', 'period': 'week'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_recipe_retrieve(self):
+        self.get(RecipeViewSet, 'retrieve',
+                 f'/api/recipes/{self.recipes[0].pk}/')
+
+    def test_recipe_match_scores(self):
+        # у рецепта i ингредиенты i, i + 1, i + 2 (по модулю 10)
+        ids = ','.join(str(item.pk) for item in self.ingredients[:2])
+        tags = [tag.slug for tag in self.tags]
+        response = self.client.get('/api/recipes/match/', {
+            'ingredients': ids, 'tags': tags, 'limit': 50})
+        scores = {recipe['name']: (recipe['matched'], recipe['missing'])
+                  for recipe in response.data['results']}
+        self.assertEqual(scores['Рецепт 0'], (2, 1))
+        self.assertEqual(scores['Рецепт 1'], (1, 2))
+        self.assertEqual(scores['Рецепт 8'], (1, 2))
+        self.assertEqual(scores['Рецепт 9'], (2, 1))
+        self.assertNotIn('Рецепт 2', scores)
+
+    def test_recipe_match(self):
+        ids = ','.join(str(item.pk) for item in self.ingredients[:3])
+        self.get(RecipeViewSet, 'match', '/api/recipes/match/',
+                 ingredients=ids)
+
+    def test_download_shopping_cart(self):
+        self.get(RecipeViewSet, 'download_shopping_cart',
+                 '/api/recipes/download_shopping_cart/')
+
+    def test_favorite(self):
+        path = f'/api/recipes/{self.recipes[-1].pk}/favorite/'
+        with query_budget(RecipeViewSet, 'favorite'):
+            response = self.client.post(path)
+        self.assertEqual(response.status_code, 201)
+        with query_budget(RecipeViewSet, 'favorite'):
+            response = self.client.delete(path)
+        self.assertEqual(response.status_code, 204)
+
+    def test_references(self):
+        self.get(TagViewSet, 'list', '/api/tags/')
+        self.get(IngredientViewSet, 'list', '/api/ingredients/',
+                 name=self.ingredients[0].name[:2])
+
+    def test_subscriptions(self):
+        self.get(SubscriptionList, None, '/api/users/subscriptions/',
+                 recipes_limit=3)
+
+    def test_subscribe(self):
+        path = f'/api/users/{self.authors[2].pk}/subscribe/'
+        with query_budget(Subscription, 'post'):
+            response = self.client.post(path)
+        self.assertEqual(response.status_code, 201)
+        with query_budget(Subscription, 'delete'):
+            response = self.client.delete(path)
+        self.assertEqual(response.status_code, 204)
+
+    def test_feed(self):
+        response = self.get(Feed, None, '/api/users/feed/')
+        self.assertTrue(response.data['results'])
+
+    def test_feed_limit(self):
+        for limit, size in (('0', 1), ('3', 3), ('1000', 50)):
+            with self.subTest(limit=limit):
+                response = self.client.get('/api/users/feed/',
+                                           {'limit': limit})
+                self.assertEqual(len(response.data['results']), size)
+        response = self.client.get('/api/users/feed/', {'limit': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_streaming_response_has_no_db_timing(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertTrue(response.streaming)
+        self.assertNotIn('db;', response['Server-Timing'])
+        response = self.client.get('/api/recipes/')
+        self.assertIn('db;', response['Server-Timing'])
+
+
+class TokenCacheTest(APITestCase):
+    """Пользователь по токену из кэша проверяется так же, как из БД."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def test_inactive_user(self):
+        # в БД пользователь активен: отказ возможен только по записи в кэше
+        self.user.is_active = False
+        cache.set(token_cache_key(self.token.key),
+                  [getattr(self.user, field) for field in USER_FIELDS])
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 401)
+
+
+class AsyncViewTest(SimpleTestCase):
+    """Потоковый ответ под ASGI читается в потоке пула по частям."""
+
+    def setUp(self):
+        self.threads = []
+
+    def view(self, request, parts=STREAM_BUFFER * 3):
+        def content():
+            for number in range(parts):
+                self.threads.append(threading.get_ident())
+                yield str(number)
+            if request.GET.get('fail'):
+                raise ValueError('fail')
+        return StreamingHttpResponse(content())
+
+    def send_response(self, path):
+        """Тела сообщений http.response.body, отправленных клиенту."""
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        async def handle():
+            request = RequestFactory().get(path)
+            response = await async_view(self.view)(request)
+            await ASGIHandler().send_response(response, send)
+
+        async_to_sync(handle)()
+        self.assertEqual(messages[-1], {'type': 'http.response.body'})
+        return [message['body'] for message in messages[1:-1]]
+
+    def test_streaming(self):
+        bodies = self.send_response('/')
+        self.assertEqual(bodies, [
+            str(number).encode() for number in range(STREAM_BUFFER * 3)])
+        # все части прочитал один поток - поток представления
+        self.assertEqual(len(set(self.threads)), 1)
+        self.assertNotEqual(self.threads[0], threading.get_ident())
+
+    def test_streaming_error(self):
+        with self.assertRaisesMessage(ValueError, 'fail'):
+            self.send_response('/?fail=1')
@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (IngredientViewSet, RecipeViewSet,
-                    Subscription, SubscriptionList, TagViewSet)
+from .async_views import async_patterns
+from .views import (Feed, IngredientViewSet, Metrics, RecipeViewSet,
+                    Subscription, SubscriptionBatch, SubscriptionList,
+                    TagViewSet)
 
 router_1 = DefaultRouter()
 router_1.register('ingredients', IngredientViewSet)
@@ -11,8 +14,17 @@ router_1.register('recipes', RecipeViewSet, basename='recipes')
 
 urlpatterns = [
     path('', include(router_1.urls)),
+    path('metrics/', Metrics.as_view(), name='metrics'),
+    path('users/feed/', Feed.as_view(), name='feed'),
     path('users/subscriptions/',
          SubscriptionList.as_view(), name='subscriptions'),
     path('users/<int:user_id>/subscribe/',
-         Subscription.as_view(), name='subscribe')
+         Subscription.as_view(), name='subscribe'),
+    path('users/subscribe/batch/',
+         SubscriptionBatch.as_view(), name='subscribe-batch'),
 ]
+
+# под ASGI представления выполняются в ограниченном пуле потоков, а не
+# в общем для всех синхронных представлений потоке Django
+if settings.ASYNC_VIEWS:
+    urlpatterns = async_patterns(urlpatterns)
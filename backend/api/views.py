@@ -1,42 +1,80 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
+from django.db import models, transaction
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, generics, permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.serializers import ValidationError
 from rest_framework.views import APIView
 
-from recipes.models import Ingredient, Recipe, ShoppingCart, Tag
+from recipes.autocomplete import DEFAULT_LIMIT, MAX_LIMIT, ingredient_index
+from recipes.feed import backfill_feed, get_feed, remove_authors
+from recipes.models import (Ingredient, Recipe, RecipeEvent,
+                            RecipeSimilarity, ShoppingCart, Tag,
+                            change_counter)
+from recipes.popularity import record_events
 from users.models import Follow
+from .authentication import token_cache_stats
 from .filters import RecipeFilter
+from .instrumentation import render_metrics
+from .mixins import CachedReferenceMixin
+from .paginators import FeedPagination, RecipeCursorPagination
 from .permissions import AuthorOrReadOnly
-from .serializers import (CustomUserExtendedSerializer, IngredientSerializer,
+from .serializers import (BatchSerializer, CustomUserExtendedSerializer,
+                          IngredientSerializer, RecipeMatchSerializer,
                           RecipeMinifiedSerializer, RecipeReadSerializer,
                           RecipeWriteSerializer, TagSerializer)
-from .services import check_favorites, check_shopping_cart, check_subscriptions
+from .services import (Favorite, add_to_favorites, add_to_shopping_cart,
+                       apply_batch, get_ingredient_ids,
+                       get_limit, get_recipes_limit, recount_counter,
+                       remove_from_favorites, remove_from_shopping_cart,
+                       subscribe, unsubscribe)
+from .shopping_list import FORMATS, shopping_list_response
 
 User = get_user_model()
 
+# рекомендаций отдаётся не больше, чем соседей хранит build_recommendations
+SIMILAR_LIMIT = 6
+MAX_SIMILAR_LIMIT = 20
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+def listed_recipes(user, ids):
+    """Рецепты для вывода в порядке ids (ранжирование сделано заранее)."""
+    recipes = Recipe.objects.for_listing(user).in_bulk(ids)
+    # рецепт могли удалить между ранжированием и загрузкой
+    return [recipes[pk] for pk in ids if pk in recipes]
+
+
+class TagViewSet(CachedReferenceMixin, viewsets.ReadOnlyModelViewSet):
     """Получение списка тегов и получение информации о теге по id."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
+    # бюджеты запросов (api.instrumentation) - с учётом промаха кэша токенов
+    query_budget = 2
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedReferenceMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """Получение списка ингредиентов / информации об ингредиенте по id."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
+    query_budget = 2
     pagination_class = None
     filter_backends = (filters.SearchFilter,)
     search_fields = ('^name',)
 
+    @action(detail=False)
+    def autocomplete(self, request):
+        """Подсказки по названию: сначала совпадения по началу строки."""
+        query = request.query_params.get('name', '')
+        limit = get_limit(request, DEFAULT_LIMIT, MAX_LIMIT)
+        return Response(ingredient_index.search(query, limit))
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Получение списка рецептов и доступ к рецепту по id.
@@ -46,100 +84,294 @@ class RecipeViewSet(viewsets.ModelViewSet):
     Добавление рецепта в избранное / удаление из избранного (action)
     Добавление рецепта в корзину / удаление из корзины (action)
     Подсчёт ингредиентов для рецептов в корзине и выгрузка файла (action)
+
+    С параметром pagination=cursor список отдаётся с keyset-пагинацией.
+    Параметр search - полнотекстовый поиск с сортировкой по релевантности.
+    ordering=popular - по популярности с затуханием
+    (period=hot/trending/steady/all).
     """
 
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
     permission_classes = (AuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    # запись - с запасом на поисковый индекс SQLite (recipes.search)
+    query_budget = {
+        'list': 5, 'retrieve': 4, 'create': 16, 'partial_update': 17,
+        'destroy': 15, 'favorite': 6, 'shopping_cart': 6, 'match': 5,
+        'similar': 3, 'recommended': 4, 'download_shopping_cart': 2,
+    }
 
     def get_queryset(self):
         user = self.request.user
+        if self.action in ('list', 'retrieve', 'match'):
+            return Recipe.objects.for_listing(user)
+        if self.action in ('favorite', 'shopping_cart', 'similar'):
+            return Recipe.objects.all()
         return Recipe.objects.with_annotations(user)
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            # курсор задаёт свой порядок и не сочетается с релевантностью
+            if (params.get('pagination') == 'cursor'
+                    and self.action == 'list' and not params.get('search')
+                    and not params.get('ordering')):
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
+        # счётчик рецептов автора и ленты подписчиков ведут сигналы
+        # recipes.signals
         serializer.save(author=self.request.user)
 
-    def manage_recipe_status(self, user, recipe):
-        """Добавление рецепта в избранное / в корзину или удаление."""
+    @transaction.atomic
+    def manage_recipe_status(self, add, remove, counter, event):
+        """Добавление рецепта в избранное / в корзину или удаление.
+
+        Наличие связи проверяет сама БД по числу затронутых строк.
+        """
+        recipe = self.get_object()
         if self.request.method == 'POST':
-            if self.action == 'favorite':
-                user.favorites.add(recipe)
-            elif self.action == 'shopping_cart':
-                ShoppingCart.objects.create(user=user, recipe=recipe)
+            add(self.request.user, recipe)
+            change_counter(Recipe, recipe.pk, counter, 1)
+            record_events(event, [recipe.pk])
             context = {'request': self.request}
             serializer = RecipeMinifiedSerializer(recipe, context=context)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        else:
-            if self.action == 'favorite':
-                user.favorites.remove(recipe)
-            elif self.action == 'shopping_cart':
-                ShoppingCart.objects.filter(user=user, recipe=recipe).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        remove(self.request.user, recipe)
+        change_counter(Recipe, recipe.pk, counter, -1)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[permissions.IsAuthenticated])
     def favorite(self, request, pk=None):
-        recipe = self.get_object()
-        check_favorites(request.user, recipe, request.method)
-        return self.manage_recipe_status(request.user, recipe)
+        return self.manage_recipe_status(
+            add_to_favorites, remove_from_favorites, 'favorites_count',
+            RecipeEvent.Kind.FAVORITE)
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[permissions.IsAuthenticated])
     def shopping_cart(self, request, pk=None):
+        return self.manage_recipe_status(
+            add_to_shopping_cart, remove_from_shopping_cart, 'in_carts_count',
+            RecipeEvent.Kind.CART)
+
+    @transaction.atomic
+    def manage_recipes_batch(self, model, counter, event):
+        """Пакетное изменение избранного / корзины."""
+        serializer = BatchSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        results, changed = apply_batch(
+            self.request.user, model, 'recipe', Recipe.objects.all(),
+            serializer.data['add'], serializer.data['remove']
+        )
+        recount_counter(Recipe, changed, counter, model, 'recipe')
+        record_events(event, [item['id'] for item in results['add']
+                              if item['status'] == 'added'])
+        return Response(results)
+
+    @action(detail=False, methods=['post'], url_path='favorite/batch',
+            permission_classes=[permissions.IsAuthenticated])
+    def favorite_batch(self, request):
+        return self.manage_recipes_batch(
+            Favorite, 'favorites_count', RecipeEvent.Kind.FAVORITE)
+
+    @action(detail=False, methods=['post'], url_path='shopping_cart/batch',
+            permission_classes=[permissions.IsAuthenticated])
+    def shopping_cart_batch(self, request):
+        return self.manage_recipes_batch(
+            ShoppingCart, 'in_carts_count', RecipeEvent.Kind.CART)
+
+    @action(detail=False)
+    def match(self, request):
+        """Что приготовить из имеющихся ингредиентов (?ingredients=1,2,3).
+
+        Сначала рецепты с наибольшей долей имеющихся ингредиентов; фильтры
+        списка (теги, автор, избранное) тоже применяются.
+        """
+        ingredient_ids = get_ingredient_ids(request)
+        queryset = self.filter_queryset(
+            self.get_queryset()).match_ingredients(ingredient_ids).order_by(
+                '-coverage', '-matched_count', '-created_ts', '-id')
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeMatchSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """Похожие рецепты по совместным добавлениям."""
         recipe = self.get_object()
-        check_shopping_cart(request.user, recipe, request.method)
-        return self.manage_recipe_status(request.user, recipe)
+        limit = get_limit(request, SIMILAR_LIMIT, MAX_SIMILAR_LIMIT)
+        ids = list(RecipeSimilarity.objects.filter(recipe=recipe).order_by(
+            '-score').values_list('similar_recipe_id', flat=True)[:limit])
+        serializer = RecipeReadSerializer(
+            listed_recipes(request.user, ids), many=True,
+            context=self.get_serializer_context())
+        return Response(serializer.data)
 
     @action(detail=False, permission_classes=[permissions.IsAuthenticated])
-    def download_shopping_cart(self, request):
+    def recommended(self, request):
+        """Рекомендации: соседи рецептов из избранного и корзины.
+
+        Оценки соседей по всем таким рецептам складываются; уже
+        добавленные пользователем рецепты не предлагаются.
+        """
         user = request.user
-        ingredients_in_cart = Ingredient.objects.filter(
-            ingredientinrecipe__recipe__shoppingcart__user=user
-        )
-        total_ingredients = ingredients_in_cart.annotate(
-            sum_=Sum('ingredientinrecipe__amount')
-        )
-        result = 'Перечень ингредиентов для рецептов из списка покупок:\n'
-        for i, item in enumerate(total_ingredients, 1):
-            line = f'{i}) {item.name} ({item.measurement_unit}): {item.sum_}\n'
-            result += line
-        # below is needed for Django 2.2; since v3.2 it supports headers=
-        response = HttpResponse(result, content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; filename="to_buy.txt"'
-        return response
+        limit = get_limit(request, SIMILAR_LIMIT, MAX_SIMILAR_LIMIT)
+        seen = {
+            *Favorite.objects.filter(user=user).values_list(
+                'recipe_id', flat=True),
+            *ShoppingCart.objects.filter(user=user).values_list(
+                'recipe_id', flat=True),
+        }
+        ids = list(RecipeSimilarity.objects.filter(recipe__in=seen).exclude(
+            similar_recipe__in=seen).values('similar_recipe_id').annotate(
+                total=models.Sum('score')).order_by('-total').values_list(
+                    'similar_recipe_id', flat=True)[:limit])
+        serializer = RecipeReadSerializer(
+            listed_recipes(user, ids), many=True,
+            context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    @action(detail=False, permission_classes=[permissions.IsAuthenticated])
+    def download_shopping_cart(self, request):
+        # параметр format занят DRF под выбор рендерера
+        file_format = request.query_params.get('type', 'txt')
+        if file_format not in FORMATS:
+            err_msg = f'Допустимые форматы: {", ".join(FORMATS)}.'
+            raise ValidationError({'errors': err_msg})
+        return shopping_list_response(request.user, file_format)
 
 
 class SubscriptionList(generics.ListAPIView):
     """Получение списка пользователей, на которых подписан текущий юзер."""
     serializer_class = CustomUserExtendedSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    query_budget = 4
 
     def get_queryset(self):
-        return User.objects.filter(following__user=self.request.user)
+        return User.objects.filter(following__user=self.request.user).annotate(
+            is_subscribed=models.Value(True, models.BooleanField())
+        )
+
+    def paginate_queryset(self, queryset):
+        """Рецепты всех авторов страницы загружаются одним запросом."""
+        authors = super().paginate_queryset(queryset)
+        if authors is None:
+            return None
+        recipes_limit = get_recipes_limit(self.request)
+        latest_recipes = {author.pk: [] for author in authors}
+        if authors and recipes_limit:
+            for recipe in Recipe.objects.latest_by_authors(
+                    list(latest_recipes), recipes_limit):
+                latest_recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.latest_recipes = latest_recipes[author.pk]
+        return authors
 
 
 class Subscription(APIView):
     """Добавление / удаление подписки."""
     http_method_names = ['post', 'delete', 'head', 'options']
+    query_budget = {'post': 9, 'delete': 6}
 
     def post(self, request, user_id):
         author = get_object_or_404(User, pk=user_id)
-        user = request.user
-        check_subscriptions(user, author, request.method)
-        Follow.objects.create(user=user, author=author)
+        with transaction.atomic():
+            subscribe(request.user, author)
+            change_counter(User, author.pk, 'followers_count', 1)
+            backfill_feed(request.user, [author])
         context = {'request': request}
         serializer = CustomUserExtendedSerializer(author, context=context)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, user_id):
         author = get_object_or_404(User, pk=user_id)
-        user = request.user
-        check_subscriptions(user, author, request.method)
-        Follow.objects.filter(user=user, author=author).delete()
+        with transaction.atomic():
+            unsubscribe(request.user, author)
+            change_counter(User, author.pk, 'followers_count', -1)
+            remove_authors(request.user, [author.pk])
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class SubscriptionBatch(APIView):
+    """Пакетное добавление / удаление подписок со статусом по каждому id."""
+    http_method_names = ['post', 'options']
+
+    @transaction.atomic
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results, changed = apply_batch(
+            request.user, Follow, 'author',
+            User.objects.exclude(pk=request.user.pk),
+            serializer.data['add'], serializer.data['remove']
+        )
+        recount_counter(User, changed, 'followers_count', Follow, 'author')
+        for item in results['add']:
+            if item['id'] == request.user.pk:
+                item['status'] = 'self_subscription'
+        added = [item['id'] for item in results['add']
+                 if item['status'] == 'added']
+        removed = [item['id'] for item in results['remove']
+                   if item['status'] == 'removed']
+        if added:
+            backfill_feed(request.user, User.objects.filter(pk__in=added))
+        if removed:
+            remove_authors(request.user, removed)
+        return Response(results)
+
+
+class Feed(APIView):
+    """Лента новых рецептов авторов, на которых подписан пользователь.
+
+    Keyset-пагинация: ссылка next ведёт на следующую страницу.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    query_budget = 6
+
+    def get(self, request):
+        paginator = FeedPagination()
+        keys, has_more = get_feed(
+            request.user, paginator.decode_cursor(request),
+            paginator.get_page_size(request)
+        )
+        page = listed_recipes(request.user, [pk for _, pk in keys])
+        serializer = RecipeReadSerializer(
+            page, many=True, context={'request': request})
+        next_link = None
+        if has_more and keys:
+            next_link = paginator.encode_cursor(request, keys[-1])
+        return paginator.get_paginated_response(serializer.data, next_link)
+
+
+class Metrics(APIView):
+    """Показатели процесса в текстовом формате Prometheus.
+
+    Счётчики ведёт каждый процесс отдельно.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        cache_stats = token_cache_stats.snapshot()
+        extra = [
+            '# HELP foodgram_token_cache_total Обращения к кэшу токенов',
+            '# TYPE foodgram_token_cache_total counter',
+            f'foodgram_token_cache_total{{result="hit"}} '
+            f'{cache_stats["hits"]}',
+            f'foodgram_token_cache_total{{result="miss"}} '
+            f'{cache_stats["misses"]}',
+        ]
+        return HttpResponse(render_metrics(extra),
+                            content_type='text/plain; version=0.0.4')
@@ -0,0 +1,167 @@
+import random
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            RecipeEvent, ShoppingCart, Tag)
+from users.models import Follow
+
+User = get_user_model()
+
+PREFIX = 'bench_user_'
+PASSWORD = 'bench-password'
+BATCH_SIZE = 5000
+SYNTHETIC_INGREDIENTS = 1000
+SYNTHETIC_TAGS = (('Завтрак', 'breakfast', '#E26C2D'),
+                  ('Обед', 'lunch', '#49B64E'),
+                  ('Ужин', 'dinner', '#8775D2'))
+DISHES = ('Суп', 'Салат', 'Пирог', 'Рагу', 'Омлет', 'Паста', 'Каша',
+          'Запеканка', 'Плов', 'Блины', 'Котлеты', 'Соус')
+MODIFIERS = ('с курицей', 'с грибами', 'овощной', 'сырный', 'рыбный',
+             'домашний', 'быстрый', 'острый', 'с тыквой', 'по-деревенски')
+
+
+class SkewedChoice:
+    """Выбор элементов с весами по закону Ципфа: вес k-го - 1 / k^skew.
+
+    skew=0 - равномерное распределение; при skew около 1 небольшая доля
+    элементов (популярные рецепты, авторы) получает большую часть выборов.
+    Порядок популярности случайный и не совпадает с порядком id.
+    """
+
+    def __init__(self, rnd, population, skew):
+        self.rnd = rnd
+        self.population = list(population)
+        rnd.shuffle(self.population)
+        self.cum_weights = list(accumulate(
+            1 / rank ** skew for rank in range(1, len(self.population) + 1)))
+
+    def sample(self, count):
+        """До count различных элементов: повторные выборы отбрасываются."""
+        if not self.population or count <= 0:
+            return []
+        return list(dict.fromkeys(self.rnd.choices(
+            self.population, cum_weights=self.cum_weights, k=count)))
+
+    def choice(self):
+        return self.sample(1)[0]
+
+
+def insert(model, objects):
+    """bulk_create порциями, не собирая все объекты в памяти."""
+    objects = iter(objects)
+    total = 0
+    while True:
+        batch = list(islice(objects, BATCH_SIZE))
+        if not batch:
+            return total
+        model.objects.bulk_create(batch)
+        total += len(batch)
+
+
+def around(rnd, mean):
+    """Случайное число со средним mean - сколько связей у пользователя."""
+    return rnd.randint(0, 2 * mean)
+
+
+def get_reference_ids(rnd):
+    """Теги и ингредиенты; если справочники пусты - синтетические."""
+    if not Ingredient.objects.exists():
+        insert(Ingredient, (
+            Ingredient(name=f'ингредиент {i}',
+                       measurement_unit=rnd.choice(('г', 'мл', 'шт.')))
+            for i in range(SYNTHETIC_INGREDIENTS)))
+    if not Tag.objects.exists():
+        insert(Tag, (Tag(name=name, slug=slug, color_code=color)
+                     for name, slug, color in SYNTHETIC_TAGS))
+    return (list(Ingredient.objects.values_list('id', flat=True)),
+            list(Tag.objects.values_list('id', flat=True)))
+
+
+def bench_users():
+    return User.objects.filter(username__startswith=PREFIX)
+
+
+def generate_dataset(users, recipes, ingredients=7, favorites=20, cart=5,
+                     follows=10, skew=1.0, seed=0):
+    """Синтетические пользователи, рецепты и связи между ними.
+
+    Авторство рецептов, подписки, избранное, корзины и ингредиенты
+    распределены по закону Ципфа с параметром skew. Остальные параметры -
+    средние числа связей на рецепт или пользователя. Все вставки идут
+    через bulk_create; счётчики, ленты и поисковый индекс не
+    обновляются - для этого есть отдельные команды. Возвращает число
+    созданных записей по моделям.
+    """
+    rnd = random.Random(seed)
+    ingredient_ids, tag_ids = get_reference_ids(rnd)
+    # хеш пароля считается один раз - это самая медленная часть
+    password = make_password(PASSWORD)
+    created = {}
+    created['users'] = insert(User, (
+        User(username=f'{PREFIX}{i}', email=f'{PREFIX}{i}@example.com',
+             password=password, first_name='Bench', last_name=f'User {i}')
+        for i in range(users)))
+    user_ids = list(bench_users().order_by('pk').values_list('pk', flat=True))
+    created['tokens'] = insert(Token, (
+        Token(key=Token.generate_key(), user_id=user_id)
+        for user_id in user_ids))
+
+    authors = SkewedChoice(rnd, user_ids, skew)
+    created['recipes'] = insert(Recipe, (
+        Recipe(author_id=authors.choice(),
+               name=f'{rnd.choice(DISHES)} {rnd.choice(MODIFIERS)} {i}',
+               text='Синтетический рецепт для нагрузочного тестирования.',
+               image='recipes/images/bench.png',
+               cooking_time=rnd.randint(5, 180))
+        for i in range(recipes)))
+    recipe_ids = list(Recipe.objects.filter(
+        author__username__startswith=PREFIX).values_list('pk', flat=True))
+
+    common_ingredients = SkewedChoice(rnd, ingredient_ids, skew)
+    created['ingredient_lines'] = insert(IngredientInRecipe, (
+        IngredientInRecipe(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                           amount=rnd.randint(1, 500))
+        for recipe_id in recipe_ids
+        for ingredient_id in common_ingredients.sample(
+            max(around(rnd, ingredients), 1))))
+    created['recipe_tags'] = insert(Recipe.tags.through, (
+        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in rnd.sample(tag_ids, rnd.randint(1, len(tag_ids)))))
+
+    popular_recipes = SkewedChoice(rnd, recipe_ids, skew)
+    favorite_pairs = [
+        (user_id, recipe_id) for user_id in user_ids
+        for recipe_id in popular_recipes.sample(around(rnd, favorites))]
+    cart_pairs = [
+        (user_id, recipe_id) for user_id in user_ids
+        for recipe_id in popular_recipes.sample(around(rnd, cart))]
+    created['favorites'] = insert(User.favorites.through, (
+        User.favorites.through(user_id=user_id, recipe_id=recipe_id)
+        for user_id, recipe_id in favorite_pairs))
+    created['carts'] = insert(ShoppingCart, (
+        ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+        for user_id, recipe_id in cart_pairs))
+    # события для update_popularity - как при добавлении через API
+    created['events'] = insert(RecipeEvent, (
+        RecipeEvent(recipe_id=recipe_id, kind=kind)
+        for pairs, kind in ((favorite_pairs, RecipeEvent.Kind.FAVORITE),
+                            (cart_pairs, RecipeEvent.Kind.CART))
+        for _, recipe_id in pairs))
+
+    popular_authors = SkewedChoice(rnd, user_ids, skew)
+    created['follows'] = insert(Follow, (
+        Follow(user_id=user_id, author_id=author_id)
+        for user_id in user_ids
+        for author_id in popular_authors.sample(around(rnd, follows))
+        if author_id != user_id))
+    return created
+
+
+def delete_dataset():
+    """Удаление синтетических пользователей и всего, что с ними связано."""
+    return bench_users().delete()[0]
@@ -0,0 +1,264 @@
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe
+from .dataset import DISHES, PREFIX
+from .results import summarize
+
+STARTUP_TIMEOUT = 30
+REQUEST_TIMEOUT = 30
+
+Scenario = namedtuple('Scenario', 'name weight path')
+
+# смесь запросов, близкая к поведению пользователей сайта
+SCENARIOS = (
+    Scenario('recipes.list', 30, '/api/recipes/?page={page}'),
+    Scenario('recipes.list_cursor', 10, '/api/recipes/?pagination=cursor'),
+    Scenario('recipes.list_by_tag', 10, '/api/recipes/?tags={tag}'),
+    Scenario('recipes.list_favorited', 5, '/api/recipes/?is_favorited=1'),
+    Scenario('recipes.popular', 5, '/api/recipes/?ordering=popular'),
+    Scenario('recipes.search', 5, '/api/recipes/?search={word}'),
+    Scenario('recipes.retrieve', 15, '/api/recipes/{recipe}/'),
+    Scenario('subscriptions', 10,
+             '/api/users/subscriptions/?recipes_limit=3'),
+    Scenario('feed', 5, '/api/users/feed/'),
+    Scenario('download_shopping_cart', 5,
+             '/api/recipes/download_shopping_cart/'),
+)
+
+
+class LoadContext:
+    """Токены и id для подстановки в URL сценариев."""
+
+    def __init__(self, users=None):
+        tokens = Token.objects.filter(user__username__startswith=PREFIX)
+        self.tokens = list(tokens.values_list('key', flat=True)[:users])
+        self.recipe_ids = list(
+            Recipe.objects.order_by('-favorites_count').values_list(
+                'pk', flat=True)[:1000])
+        self.tags = list(
+            Recipe.tags.through.objects.values_list(
+                'tag__slug', flat=True).distinct())
+
+    def path(self, scenario, rnd):
+        return scenario.path.format(
+            page=rnd.randint(1, 5), tag=rnd.choice(self.tags),
+            word=quote(rnd.choice(DISHES)),
+            recipe=rnd.choice(self.recipe_ids))
+
+
+class Worker(threading.Thread):
+    """Клиент с keep-alive соединением: запросы подряд до конца прогона."""
+
+    def __init__(self, url, context, scenarios, deadline, seed):
+        super().__init__(daemon=True)
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.context = context
+        self.scenarios = scenarios
+        self.cum_weights = []
+        total = 0
+        for scenario in scenarios:
+            total += scenario.weight
+            self.cum_weights.append(total)
+        self.deadline = deadline
+        self.rnd = random.Random(seed)
+        self.connection = None
+        self.recording = False
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def connect(self):
+        self.connection = http.client.HTTPConnection(
+            self.host, self.port, timeout=REQUEST_TIMEOUT)
+
+    def request(self, path, token):
+        if self.connection is None:
+            self.connect()
+        try:
+            self.connection.request(
+                'GET', path, headers={'Authorization': f'Token {token}'})
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException) as error:
+            self.connection.close()
+            self.connection = None
+            return type(error).__name__
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            scenario = self.rnd.choices(
+                self.scenarios, cum_weights=self.cum_weights)[0]
+            path = self.context.path(scenario, self.rnd)
+            token = self.rnd.choice(self.context.tokens)
+            started = time.perf_counter()
+            status = self.request(path, token)
+            elapsed = time.perf_counter() - started
+            if self.recording:
+                self.latencies[scenario.name].append(elapsed)
+                self.statuses[scenario.name][status] += 1
+        if self.connection is not None:
+            self.connection.close()
+
+
+class SlowClient(threading.Thread):
+    """Медленный клиент: заголовки запроса приходят по строке в interval
+    секунд, пока не пройдёт hold секунд, затем ответ читается целиком.
+
+    Так ведут себя мобильные клиенты на плохой связи без буферизующего
+    прокси: синхронный воркер всё это время занят одним соединением.
+    """
+
+    def __init__(self, url, token, deadline, hold, interval=0.5):
+        super().__init__(daemon=True)
+        parts = urlsplit(url)
+        self.address = (parts.hostname, parts.port or 80)
+        self.token = token
+        self.deadline = deadline
+        self.hold = hold
+        self.interval = interval
+        self.completed = 0
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            try:
+                self.slow_request()
+                self.completed += 1
+            except OSError:
+                time.sleep(self.interval)
+
+    def slow_request(self):
+        with socket.create_connection(
+                self.address, timeout=REQUEST_TIMEOUT) as sock:
+            sock.sendall(
+                f'GET /api/recipes/ HTTP/1.1\r\nHost: {self.address[0]}\r\n'
+                f'Authorization: Token {self.token}\r\n'.encode('ascii'))
+            finish = min(time.monotonic() + self.hold, self.deadline)
+            while time.monotonic() < finish:
+                time.sleep(self.interval)
+                sock.sendall(b'X-Slow-Client: 1\r\n')
+            sock.sendall(b'Connection: close\r\n\r\n')
+            while sock.recv(65536):
+                pass
+
+
+def run_load(url, context, scenarios, concurrency, duration, warmup, seed=0,
+             slow_clients=0, slow_hold=5):
+    """Нагрузка из concurrency клиентов; замеры без первых warmup секунд.
+
+    Клиенты - потоки этого процесса: для нескольких сотен одновременных
+    соединений их достаточно, ожидание ответа сервера отпускает GIL.
+    slow_clients медленных клиентов занимают соединения всё время прогона.
+    """
+    deadline = time.monotonic() + warmup + duration
+    slow = [SlowClient(url, context.tokens[i % len(context.tokens)],
+                       deadline, slow_hold)
+            for i in range(slow_clients)]
+    workers = [Worker(url, context, scenarios, deadline, seed + i)
+               for i in range(concurrency)]
+    for worker in slow + workers:
+        worker.start()
+    time.sleep(warmup)
+    for worker in workers:
+        worker.recording = True
+    started = time.monotonic()
+    for worker in slow + workers:
+        worker.join()
+    elapsed = time.monotonic() - started
+
+    latencies, statuses = defaultdict(list), defaultdict(Counter)
+    for worker in workers:
+        for name, samples in worker.latencies.items():
+            latencies[name].extend(samples)
+            statuses[name].update(worker.statuses[name])
+    results = {}
+    all_samples, all_errors = [], 0
+    for name in sorted(latencies):
+        errors = sum(count for status, count in statuses[name].items()
+                     if not isinstance(status, int) or status >= 400)
+        results[name] = dict(
+            summarize(latencies[name]),
+            rps=round(len(latencies[name]) / elapsed, 2), errors=errors,
+            statuses={str(status): count
+                      for status, count in statuses[name].items()})
+        all_samples.extend(latencies[name])
+        all_errors += errors
+    results['total'] = dict(
+        summarize(all_samples),
+        rps=round(len(all_samples) / elapsed, 2), errors=all_errors)
+    if slow:
+        results['slow_clients'] = {
+            'clients': len(slow),
+            'completed': sum(client.completed for client in slow)}
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(
+                f'Сервер завершился с кодом {process.returncode}.')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Сервер не начал принимать соединения.')
+
+
+def start_server(command, port, threads):
+    """Локальный сервер приложения с настройками текущего окружения.
+
+    В лог пишутся только превышения бюджета запросов.
+    """
+    env = dict(os.environ, INSTRUMENTATION_LOG_LEVEL='WARNING',
+               ASYNC_VIEW_WORKERS=str(threads))
+    process = subprocess.Popen(
+        [sys.executable, '-m', *command], cwd=settings.BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, process)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=STARTUP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def gunicorn_command(server, port, workers, threads):
+    """gunicorn с синхронными воркерами (WSGI) или воркерами uvicorn (ASGI).
+
+    threads для ASGI - размер пула представлений (ASYNC_VIEW_WORKERS).
+    """
+    command = ['gunicorn', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--log-level', 'warning']
+    if server == 'async':
+        return command + ['foodgram.asgi:application',
+                          '--worker-class', 'uvicorn.workers.UvicornWorker']
+    return command + ['foodgram.wsgi:application', '--threads', str(threads)]
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.results import read_results
+
+# для нагрузочного теста важнее хвост задержек, для микробенчмарков - медиана
+METRICS = {'micro': 'p50_ms', 'load': 'p95_ms'}
+
+
+class Command(BaseCommand):
+    help = ('Сравнение двух JSON-результатов run_benchmarks или load_test, '
+            'например до и после коммита.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline')
+        parser.add_argument('current')
+        parser.add_argument('--threshold', type=float, default=10,
+                            help='Замедление в процентах, которое '
+                                 'считается регрессией.')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        baseline = read_results(options['baseline'])
+        current = read_results(options['current'])
+        if baseline['kind'] != current['kind']:
+            raise CommandError('Результаты разных типов нельзя сравнивать.')
+        metric = METRICS[baseline['kind']]
+        self.stdout.write(
+            f'{metric}: {baseline["environment"]["commit"]} -> '
+            f'{current["environment"]["commit"]}')
+
+        regressions = []
+        for name, result in current['results'].items():
+            before = baseline['results'].get(name, {}).get(metric)
+            after = result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            line = (f'{name:<40} {before:>9.3f} -> {after:>9.3f}  '
+                    f'{change:+.1f}%')
+            queries_before = baseline['results'][name].get('queries')
+            if queries_before != result.get('queries'):
+                line += (f'  запросов {queries_before} -> '
+                         f'{result.get("queries")}')
+            if change > options['threshold']:
+                regressions.append(name)
+                self.stdout.write(self.style.WARNING(line))
+            else:
+                self.stdout.write(line)
+
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'Регрессии: {", ".join(regressions)}')
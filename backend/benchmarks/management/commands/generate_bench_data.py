@@ -0,0 +1,60 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from benchmarks.dataset import (PASSWORD, bench_users, delete_dataset,
+                                generate_dataset)
+
+
+class Command(BaseCommand):
+    help = ('Синтетические данные для бенчмарков и нагрузочного '
+            'тестирования: пользователи bench_user_N (пароль '
+            f'{PASSWORD}) с токенами, рецепты, избранное, корзины и '
+            'подписки с неравномерным распределением популярности.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients', type=int, default=7,
+                            help='Среднее число ингредиентов в рецепте.')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Среднее число избранных рецептов.')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Среднее число рецептов в корзине.')
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Среднее число подписок.')
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help='Показатель распределения Ципфа: 0 - '
+                                 'равномерно, больше - сильнее перекос.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true',
+                            help='Удалить ранее созданные данные.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = delete_dataset()
+            self.stdout.write(f'Удалено записей: {deleted}')
+        elif bench_users().exists():
+            raise CommandError(
+                'Синтетические данные уже есть - используйте --clear.')
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            created = generate_dataset(
+                options['users'], options['recipes'],
+                ingredients=options['ingredients'],
+                favorites=options['favorites'], cart=options['cart'],
+                follows=options['follows'], skew=options['skew'],
+                seed=options['seed'])
+        for name, count in created.items():
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(
+            f'Вставка заняла {time.perf_counter() - started:.1f} с.')
+
+        # производные данные - теми же командами, что и в эксплуатации
+        for command in ('recount_counters', 'backfill_feeds',
+                        'rebuild_search_index', 'update_popularity'):
+            call_command(command, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Данные созданы.'))
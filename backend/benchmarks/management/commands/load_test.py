@@ -0,0 +1,112 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.load import (SCENARIOS, LoadContext, free_port,
+                             gunicorn_command, run_load, start_server,
+                             stop_server)
+from benchmarks.results import write_results
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест API: смесь GET-запросов синтетических '
+            'пользователей, задержки p50/p95/p99 и пропускная способность. '
+            'По умолчанию запускает gunicorn на свободном порту; с '
+            '--server sync async сравнивает WSGI и ASGI при одинаковой '
+            'нагрузке.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url',
+                            help='Адрес уже запущенного сервера, например '
+                                 'http://127.0.0.1:8000; без него '
+                                 'запускается gunicorn.')
+        parser.add_argument('--server', nargs='+', default=['sync'],
+                            choices=('sync', 'async'),
+                            help='sync - WSGI и синхронные воркеры, async - '
+                                 'ASGI и воркеры uvicorn.')
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Процессы gunicorn.')
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Потоки в процессе: gunicorn для sync, '
+                                 'пул представлений для async.')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Одновременные клиенты.')
+        parser.add_argument('--slow-clients', type=int, default=0,
+                            help='Дополнительные медленные клиенты.')
+        parser.add_argument('--slow-hold', type=float, default=5,
+                            help='Сколько секунд медленный клиент '
+                                 'отправляет запрос.')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Длительность замера, секунды.')
+        parser.add_argument('--warmup', type=float, default=5,
+                            help='Прогрев без замеров, секунды.')
+        parser.add_argument('--users', type=int,
+                            help='Сколько синтетических пользователей '
+                                 'задействовать.')
+        parser.add_argument('--scenario', action='append',
+                            choices=[scenario.name
+                                     for scenario in SCENARIOS],
+                            help='Только эти сценарии; можно указать '
+                                 'несколько.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='load.json')
+
+    def handle(self, *args, **options):
+        context = LoadContext(options['users'])
+        if not context.tokens or not context.recipe_ids:
+            raise CommandError(
+                'Нет синтетических данных - запустите generate_bench_data.')
+        scenarios = [scenario for scenario in SCENARIOS
+                     if not options['scenario']
+                     or scenario.name in options['scenario']]
+        servers = ['external'] if options['url'] else options['server']
+
+        results = {}
+        for server in servers:
+            self.stdout.write(f'[{server}]')
+            for name, result in self.run_server(
+                    server, context, scenarios, options).items():
+                self.write_result(name, result)
+                results[f'{server}:{name}'] = result
+        if len(servers) > 1:
+            self.stdout.write('Итого:')
+            for server in servers:
+                self.write_result(server, results[f'{server}:total'])
+
+        params = {key: options[key] for key in (
+            'url', 'server', 'workers', 'threads', 'concurrency',
+            'slow_clients', 'slow_hold', 'duration', 'warmup', 'users',
+            'scenario', 'seed')}
+        write_results(options['output'], 'load', params, results)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}'))
+
+    def run_server(self, server, context, scenarios, options):
+        process, url = None, options['url']
+        if url is None:
+            port = free_port()
+            try:
+                process = start_server(gunicorn_command(
+                    server, port, options['workers'], options['threads']),
+                    port, options['threads'])
+            except RuntimeError as error:
+                raise CommandError(error)
+            url = f'http://127.0.0.1:{port}'
+        try:
+            return run_load(
+                url, context, scenarios, options['concurrency'],
+                options['duration'], options['warmup'], options['seed'],
+                options['slow_clients'], options['slow_hold'])
+        finally:
+            if process is not None:
+                stop_server(process)
+
+    def write_result(self, name, result):
+        if 'rps' not in result:
+            self.stdout.write(f'{name:<30} медленных запросов выполнено: '
+                              f'{result["completed"]}')
+            return
+        self.stdout.write(
+            f'{name:<30} {result["rps"]:>8.1f} rps  '
+            f'p50 {result.get("p50_ms", 0):>8.1f}  '
+            f'p95 {result.get("p95_ms", 0):>8.1f}  '
+            f'p99 {result.get("p99_ms", 0):>8.1f} мс  '
+            f'ошибок {result["errors"]}')
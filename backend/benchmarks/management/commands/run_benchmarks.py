@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.micro import get_cases, pick_users, run_cases
+from benchmarks.results import write_results
+
+
+class Command(BaseCommand):
+    help = ('Микробенчмарки запросов, сериализаторов и представлений на '
+            'данных generate_bench_data. Результат - JSON для '
+            'compare_benchmarks.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--filter', default='',
+                            help='Только сценарии, в имени которых есть '
+                                 'эта строка.')
+        parser.add_argument('--output', default='benchmarks.json')
+
+    def handle(self, *args, **options):
+        user, author = pick_users()
+        if user is None:
+            raise CommandError(
+                'Нет синтетических данных - запустите generate_bench_data.')
+        cases = [case for case in get_cases(user, author)
+                 if options['filter'] in case.name]
+        results = run_cases(cases, options['repeat'], options['warmup'],
+                            write=self.write_result)
+        params = {key: options[key] for key in ('repeat', 'warmup', 'filter')}
+        params.update(user=user.pk, author=author.pk)
+        write_results(options['output'], 'micro', params, results)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}'))
+
+    def write_result(self, name, result):
+        line = (f'{name:<45} p50 {result["p50_ms"]:>9.3f} мс  '
+                f'p95 {result["p95_ms"]:>9.3f} мс  '
+                f'запросов {result["queries"]}')
+        budget = result.get('query_budget')
+        if budget is not None and result['queries'] > budget:
+            self.stdout.write(self.style.WARNING(
+                f'{line}  бюджет {budget} превышен'))
+        else:
+            self.stdout.write(line)
@@ -0,0 +1,269 @@
+import base64
+import io
+import time
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.filters import RecipeFilter
+from api.instrumentation import QueryRecorder, resolve_view
+from api.serializers import (BatchSerializer, CustomUserExtendedSerializer,
+                             IngredientSerializer, RecipeMatchSerializer,
+                             RecipeReadSerializer, RecipeWriteSerializer,
+                             TagSerializer)
+from api.services import MAX_BATCH_SIZE
+from api.services import Favorite
+from api.shopping_list import get_cart_ingredients
+from api.views import Feed, RecipeViewSet, SubscriptionList
+from recipes.feed import get_feed
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from .dataset import DISHES, bench_users
+from .results import summarize
+
+User = get_user_model()
+
+PAGE_SIZE = 6
+LARGE_PAGE_SIZE = 50
+RECIPES_LIMIT = 3
+
+Case = namedtuple('Case', 'group name func view')
+
+
+def measure(func, repeat, warmup):
+    """Длительности repeat вызовов func и число SQL-запросов на вызов."""
+    for _ in range(warmup):
+        func()
+    durations = []
+    recorder = None
+    for _ in range(repeat):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            started = time.perf_counter()
+            func()
+            durations.append(time.perf_counter() - started)
+    result = summarize(durations)
+    result['queries'] = recorder.count if recorder else None
+    return result
+
+
+def pick_users():
+    """Самый активный синтетический пользователь и самый популярный автор."""
+    user = bench_users().annotate(
+        follows=Count('follower', distinct=True),
+        cart=Count('shoppingcart', distinct=True),
+    ).order_by('-follows', '-cart', 'pk').first()
+    author = bench_users().order_by('-followers_count', 'pk').first()
+    return user, author
+
+
+def make_request(user, path, **params):
+    request = APIRequestFactory().get(path, params)
+    force_authenticate(request, user=user)
+    return request
+
+
+def make_drf_request(user, path, **params):
+    """Request для контекста сериализаторов, как в представлениях."""
+    request = Request(APIRequestFactory().get(path, params))
+    request.user = user
+    return request
+
+
+def filter_recipes(user, **params):
+    """Список рецептов с фильтрами так, как его строит RecipeViewSet."""
+    request = make_drf_request(user, '/api/recipes/', **params)
+    return RecipeFilter(request.query_params,
+                        queryset=Recipe.objects.for_listing(user),
+                        request=request).qs
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return f'data:image/png;base64,{encoded}'
+
+
+def call_view(view, request, **kwargs):
+    """Полный цикл представления DRF, включая рендеринг ответа."""
+    response = view(request, **kwargs)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    else:
+        response.render()
+    return response
+
+
+def queryset_cases(user, author):
+    recipes = Recipe.objects.for_listing(user)
+    tag = Tag.objects.first()
+    ingredient_ids = list(IngredientInRecipe.objects.filter(
+        recipe__in=Favorite.objects.filter(user=user).values('recipe')
+    ).values_list('ingredient_id', flat=True).distinct()[:10])
+    followed_ids = list(User.objects.filter(
+        following__user=user).values_list('pk', flat=True)[:PAGE_SIZE])
+
+    def is_favorited_id_set():
+        # альтернатива Exists: страница без аннотаций + один запрос id
+        page = list(Recipe.objects.all()[:PAGE_SIZE])
+        favorited = set(Favorite.objects.filter(
+            user=user, recipe__in=page).values_list('recipe_id', flat=True))
+        return [recipe.pk in favorited for recipe in page]
+
+    return [
+        Case('queryset', 'recipes.for_listing',
+             lambda: list(recipes[:PAGE_SIZE]), None),
+        Case('queryset', 'recipes.by_author',
+             lambda: list(filter_recipes(
+                 user, author=author.pk)[:PAGE_SIZE]), None),
+        Case('queryset', 'recipes.by_tag',
+             lambda: list(filter_recipes(
+                 user, tags=tag.slug)[:PAGE_SIZE]), None),
+        Case('queryset', 'recipes.popular',
+             lambda: list(filter_recipes(
+                 user, ordering='popular')[:PAGE_SIZE]), None),
+        Case('queryset', 'recipes.search',
+             lambda: list(filter_recipes(
+                 user, search=DISHES[0])[:PAGE_SIZE]), None),
+        Case('queryset', 'recipes.match_ingredients',
+             lambda: list(filter_recipes(user).match_ingredients(
+                 ingredient_ids).order_by(
+                 '-coverage', '-matched_count', '-created_ts',
+                 '-id')[:PAGE_SIZE]), None),
+        Case('queryset', 'is_favorited.exists_annotation',
+             lambda: [recipe.is_favorited for recipe in
+                      Recipe.objects.with_annotations(user)[:PAGE_SIZE]],
+             None),
+        Case('queryset', 'is_favorited.id_set', is_favorited_id_set, None),
+        Case('queryset', 'subscriptions.latest_recipes',
+             lambda: list(Recipe.objects.latest_by_authors(
+                 followed_ids, RECIPES_LIMIT)), None),
+        Case('queryset', 'shopping_list.aggregate',
+             lambda: list(get_cart_ingredients(user)), None),
+        Case('queryset', 'feed.keys', lambda: get_feed(user, None, PAGE_SIZE),
+             None),
+    ]
+
+
+def serializer_cases(user):
+    """Только сериализация: объекты загружены заранее."""
+    request = make_drf_request(user, '/api/recipes/',
+                               recipes_limit=RECIPES_LIMIT)
+    context = {'request': request}
+    recipes = Recipe.objects.for_listing(user)
+    page = list(recipes[:PAGE_SIZE])
+    large_page = list(recipes[:LARGE_PAGE_SIZE])
+
+    subscriptions = SubscriptionList(request=request, format_kwarg=None)
+    authors = subscriptions.paginate_queryset(subscriptions.get_queryset())
+    # справочники отдаются целиком, без пагинации
+    tags = list(Tag.objects.all())
+    all_ingredients = list(Ingredient.objects.all())
+
+    ingredients = IngredientInRecipe.objects.values_list(
+        'ingredient_id', flat=True).distinct()[:5]
+    matches = list(recipes.match_ingredients(list(ingredients)).order_by(
+        '-coverage', '-matched_count', '-created_ts', '-id')[:PAGE_SIZE])
+    batch = {'add': list(range(1, MAX_BATCH_SIZE // 2 + 1)),
+             'remove': list(range(MAX_BATCH_SIZE // 2 + 1,
+                                  MAX_BATCH_SIZE + 1))}
+    payload = {
+        'name': 'Бенчмарк', 'text': 'Текст', 'cooking_time': 10,
+        'image': make_image(),
+        'tags': list(Tag.objects.values_list('pk', flat=True)[:2]),
+        'ingredients': [{'id': pk, 'amount': 10} for pk in ingredients],
+    }
+
+    def validate_write():
+        serializer = RecipeWriteSerializer(data=payload, context=context)
+        serializer.is_valid(raise_exception=True)
+
+    def validate_batch():
+        serializer = BatchSerializer(data=batch)
+        serializer.is_valid(raise_exception=True)
+
+    return [
+        Case('serializer', 'RecipeReadSerializer.page',
+             lambda: RecipeReadSerializer(
+                 page, many=True, context=context).data, None),
+        Case('serializer', 'RecipeReadSerializer.large_page',
+             lambda: RecipeReadSerializer(
+                 large_page, many=True, context=context).data, None),
+        Case('serializer', 'CustomUserExtendedSerializer.page',
+             lambda: CustomUserExtendedSerializer(
+                 authors, many=True, context=context).data, None),
+        Case('serializer', 'RecipeMatchSerializer.page',
+             lambda: RecipeMatchSerializer(
+                 matches, many=True, context=context).data, None),
+        Case('serializer', 'TagSerializer.all',
+             lambda: TagSerializer(tags, many=True).data, None),
+        Case('serializer', 'IngredientSerializer.all',
+             lambda: IngredientSerializer(
+                 all_ingredients, many=True).data, None),
+        Case('serializer', 'RecipeWriteSerializer.validate', validate_write,
+             None),
+        Case('serializer', 'BatchSerializer.validate', validate_batch, None),
+    ]
+
+
+def view_cases(user, author):
+    """Представления целиком - с проверкой прав, фильтрами и рендерингом."""
+    recipe = Recipe.objects.order_by('-favorites_count').first()
+    recipe_list = RecipeViewSet.as_view({'get': 'list'})
+    recipe_detail = RecipeViewSet.as_view({'get': 'retrieve'})
+    download = RecipeViewSet.as_view({'get': 'download_shopping_cart'})
+    subscriptions = SubscriptionList.as_view()
+    feed = Feed.as_view()
+    tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+    return [
+        Case('view', 'RecipeViewSet.list',
+             lambda: call_view(recipe_list, make_request(
+                 user, '/api/recipes/')), recipe_list),
+        Case('view', 'RecipeViewSet.list_by_author',
+             lambda: call_view(recipe_list, make_request(
+                 user, '/api/recipes/', author=author.pk)), recipe_list),
+        Case('view', 'RecipeViewSet.list_by_tags',
+             lambda: call_view(recipe_list, make_request(
+                 user, '/api/recipes/', tags=tags)), recipe_list),
+        Case('view', 'RecipeViewSet.list_favorited',
+             lambda: call_view(recipe_list, make_request(
+                 user, '/api/recipes/', is_favorited=1)), recipe_list),
+        Case('view', 'RecipeViewSet.retrieve',
+             lambda: call_view(recipe_detail, make_request(
+                 user, f'/api/recipes/{recipe.pk}/'), pk=recipe.pk),
+             recipe_detail),
+        Case('view', 'RecipeViewSet.download_shopping_cart',
+             lambda: call_view(download, make_request(
+                 user, '/api/recipes/download_shopping_cart/')), download),
+        Case('view', 'SubscriptionList.get',
+             lambda: call_view(subscriptions, make_request(
+                 user, '/api/users/subscriptions/',
+                 recipes_limit=RECIPES_LIMIT)), subscriptions),
+        Case('view', 'Feed.get',
+             lambda: call_view(feed, make_request(user, '/api/users/feed/')),
+             feed),
+    ]
+
+
+def get_cases(user, author):
+    return (queryset_cases(user, author) + serializer_cases(user)
+            + view_cases(user, author))
+
+
+def run_cases(cases, repeat, warmup, write=None):
+    """Прогон сценариев; для представлений - сверка с query_budget."""
+    results = {}
+    for case in cases:
+        result = measure(case.func, repeat, warmup)
+        result['group'] = case.group
+        if case.view is not None:
+            result['query_budget'] = resolve_view(case.view, 'get')[1]
+        results[case.name] = result
+        if write:
+            write(case.name, result)
+    return results
@@ -0,0 +1,74 @@
+import json
+import math
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.db import connection
+
+
+def percentile(ordered, fraction):
+    """Перцентиль по методу ближайшего ранга; ordered - отсортированный."""
+    if not ordered:
+        return None
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """Сводка по длительностям в секундах: миллисекунды, p50/p95/p99."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0}
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def git(*args):
+    try:
+        return subprocess.run(
+            ('git', *args), cwd=settings.BASE_DIR, capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Окружение запуска: коммит, версии, СУБД - для сравнения прогонов."""
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'host': platform.node(),
+    }
+
+
+def write_results(path, kind, params, results):
+    """Результаты прогона в JSON: {kind, environment, params, results}."""
+    report = {
+        'kind': kind,
+        'environment': environment(),
+        'params': params,
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    return report
+
+
+def read_results(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
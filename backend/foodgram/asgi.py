@@ -0,0 +1,13 @@
+import os
+
+import django
+
+from api.asgi import ASGIHandler
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+# Django 3.2 выполняет синхронные представления под ASGI в одном общем
+# потоке, поэтому представления API переводятся на свой пул (api.async_views)
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
+django.setup(set_prefix=False)
+application = ASGIHandler()
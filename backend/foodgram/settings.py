@@ -25,9 +25,11 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig',
+    'benchmarks.apps.BenchmarksConfig',
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -73,6 +75,18 @@ DATABASES = {
     }
 }
 
+# по умолчанию локальный кэш процесса; для общего кэша (Redis, memcached)
+# задайте CACHE_BACKEND и CACHE_LOCATION
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+REFERENCE_CACHE_TIMEOUT = int(os.getenv('REFERENCE_CACHE_TIMEOUT', 300))
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', 300))
 
 AUTH_USER_MODEL = 'users.User'
 
@@ -97,7 +111,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.paginators.CustomPageNumberPagination',
     'SEARCH_PARAM': 'name'
@@ -126,6 +140,33 @@ STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+# потоки для создания уменьшенных копий картинок рецептов
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+# рецепты авторов с большим числом подписчиков не рассылаются по лентам,
+# а читаются при запросе ленты
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+# асинхронные обёртки представлений API (включаются в asgi.py) и число
+# потоков для них в каждом процессе - не больше доступных соединений с БД
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+ASYNC_VIEW_WORKERS = int(os.getenv('ASYNC_VIEW_WORKERS', 8))
+
+# строка JSON на каждый запрос к API: число и время SQL-запросов. По
+# умолчанию пишутся только превышения бюджета запросов (WARNING), все
+# запросы - с INSTRUMENTATION_LOG_LEVEL=INFO
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.instrumentation': {
+            'handlers': ['console'],
+            'level': os.getenv('INSTRUMENTATION_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
 
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
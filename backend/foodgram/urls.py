@@ -3,11 +3,20 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from api.async_views import async_patterns
+
+djoser_urls = [
+    path('api/', include('djoser.urls')),
+    path('api/auth/', include('djoser.urls.authtoken')),
+]
+# представления api.urls оборачиваются там же
+if settings.ASYNC_VIEWS:
+    djoser_urls = async_patterns(djoser_urls)
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
-    path('api/', include('djoser.urls')),
-    path('api/auth/', include('djoser.urls.authtoken')),
+    *djoser_urls,
 ]
 
 if settings.DEBUG:
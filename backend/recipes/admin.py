@@ -1,6 +1,11 @@
 from django.contrib import admin
+from django.contrib.auth import get_user_model
 
-from .models import Ingredient, IngredientInRecipe, Recipe, Tag
+from .models import (Ingredient, IngredientInRecipe, Recipe, Tag,
+                     change_counter, count_by)
+from .search import update_search_index
+
+User = get_user_model()
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -20,17 +25,28 @@ class IngredientInRecipeInline(admin.TabularInline):
 
 class RecipeAdmin(admin.ModelAdmin):
     fields = (('name', 'author'), 'image', 'text', 'cooking_time', 'tags',
-              'favorite_count')
-    readonly_fields = ('favorite_count', )
+              'favorites_count')
+    readonly_fields = ('favorites_count', )
     list_display = ('name', 'author')
     list_filter = ('name', 'author__username', 'tags')
     search_fields = ('name',)
     inlines = (IngredientInRecipeInline,)
 
-    def favorite_count(self, obj):
-        return obj.user_favorites.count()
-
-    favorite_count.short_description = 'Число добавлений в избранное'
+    def save_model(self, request, obj, form, change):
+        # создание и удаление учитывают сигналы, смену автора - только здесь
+        super().save_model(request, obj, form, change)
+        if change and 'author' in form.changed_data:
+            change_counter(User, form.initial['author'], 'recipes_count', -1)
+            change_counter(User, obj.author_id, 'recipes_count', 1)
+
+    def save_related(self, request, form, formsets, change):
+        # индекс и число ингредиентов - по строкам состава, они
+        # сохраняются после рецепта
+        super().save_related(request, form, formsets, change)
+        recipes = Recipe.objects.filter(pk=form.instance.pk)
+        recipes.update(ingredients_count=count_by(
+            IngredientInRecipe.objects, 'recipe'))
+        update_search_index([form.instance.pk])
 
 
 admin.site.register(Tag, TagAdmin)
@@ -0,0 +1,81 @@
+import threading
+import time
+from bisect import bisect_left
+
+from .cache import get_version
+from .models import Ingredient
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# страховка для локального кэша: версия не видна соседним процессам
+INDEX_TTL = 300
+
+
+class IngredientPrefixIndex:
+    """Отсортированный в памяти индекс названий ингредиентов.
+
+    Поиск по префиксу - бинарный поиск по отсортированному списку,
+    затем (если не хватило результатов) - поиск по вхождению подстроки.
+    Индекс перестраивается лениво при смене версии справочника
+    ингредиентов (см. recipes.signals).
+    """
+
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # ключи, записи, время и версия сборки заменяются одним
+        # присваиванием: поиск без блокировки не увидит их вперемешку
+        self._index = ([], [], None, None)
+
+    def is_stale(self, index):
+        _, _, built_at, version = index
+        return (built_at is None
+                or version != get_version(Ingredient._meta.label_lower)
+                or time.monotonic() - built_at > self.ttl)
+
+    def rebuild(self):
+        """Сборка индекса; параллельные запросы ждут одну сборку."""
+        with self._lock:
+            # пока ждали блокировку, индекс мог собрать другой поток
+            if not self.is_stale(self._index):
+                return self._index
+            version = get_version(Ingredient._meta.label_lower)
+            rows = Ingredient.objects.order_by().values_list(
+                'id', 'name', 'measurement_unit')
+            entries = sorted(
+                (name.lower(), name, measurement_unit, pk)
+                for pk, name, measurement_unit in rows
+            )
+            keys = [entry[0] for entry in entries]
+            items = [
+                {'id': pk, 'name': name, 'measurement_unit': unit}
+                for _, name, unit, pk in entries
+            ]
+            self._index = (keys, items, time.monotonic(), version)
+            return self._index
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        index = self._index
+        if self.is_stale(index):
+            index = self.rebuild()
+        keys, items, _, _ = index
+        query = query.strip().lower()
+
+        result = []
+        position = bisect_left(keys, query)
+        while (position < len(keys) and len(result) < limit
+               and keys[position].startswith(query)):
+            result.append(items[position])
+            position += 1
+        if len(result) == limit:
+            return result
+
+        for key, item in zip(keys, items):
+            if query in key and not key.startswith(query):
+                result.append(item)
+                if len(result) == limit:
+                    break
+        return result
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,25 @@
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'reference:{}:version'
+
+
+def get_version(label):
+    """Текущая версия справочника (тегов, ингредиентов) в кэше."""
+    key = VERSION_KEY.format(label)
+    version = cache.get(key)
+    if version is None:
+        # начальное значение не должно совпасть с версией до вытеснения
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(label):
+    """Смена версии делает недействительными все закэшированные ответы."""
+    key = VERSION_KEY.format(label)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
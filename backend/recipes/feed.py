@@ -0,0 +1,102 @@
+import heapq
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from .models import FeedItem, Recipe
+
+User = get_user_model()
+
+# сколько последних рецептов автора попадает в ленту при подписке
+BACKFILL_RECIPES = 50
+BATCH_SIZE = 1000
+
+
+def is_popular(author):
+    return author.followers_count > settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def push_recipe(recipe):
+    """Рассылка нового рецепта по лентам подписчиков автора."""
+    if is_popular(recipe.author):
+        return
+    follower_ids = recipe.author.following.values_list('user_id', flat=True)
+    FeedItem.objects.bulk_create(
+        (FeedItem(user_id=user_id, recipe_id=recipe.pk,
+                  author_id=recipe.author_id, created_ts=recipe.created_ts)
+         for user_id in follower_ids.iterator()),
+        batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def backfill_feed(user, authors, limit=BACKFILL_RECIPES):
+    """Последние рецепты авторов в ленту пользователя (после подписки).
+
+    Популярные авторы пропускаются: их рецепты и так читаются при запросе.
+    """
+    items = []
+    for author in authors:
+        if is_popular(author):
+            continue
+        recipes = Recipe.objects.filter(author=author).order_by(
+            '-created_ts', '-id').values_list('pk', 'created_ts')[:limit]
+        items.extend(
+            FeedItem(user_id=user.pk, recipe_id=recipe_id,
+                     author_id=author.pk, created_ts=created_ts)
+            for recipe_id, created_ts in recipes
+        )
+    FeedItem.objects.bulk_create(
+        items, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return len(items)
+
+
+def remove_authors(user, author_ids):
+    """Удаление рецептов авторов из ленты после отписки."""
+    FeedItem.objects.filter(user=user, author__in=author_ids).delete()
+
+
+def before(cursor, ts_field, id_field):
+    """Условие keyset-пагинации: строки строго после курсора."""
+    if cursor is None:
+        return Q()
+    created_ts, pk = cursor
+    return Q(**{f'{ts_field}__lt': created_ts}) | Q(
+        **{ts_field: created_ts, f'{id_field}__lt': pk})
+
+
+def pushed_keys(user, cursor, limit):
+    """Ключи (created_ts, id) из записей ленты пользователя."""
+    return FeedItem.objects.filter(
+        before(cursor, 'created_ts', 'recipe_id'), user=user
+    ).order_by('-created_ts', '-recipe_id').values_list(
+        'created_ts', 'recipe_id')[:limit]
+
+
+def get_feed(user, cursor, limit):
+    """Ключи (created_ts, id) рецептов следующей страницы ленты.
+
+    Слияние двух упорядоченных потоков: записи ленты пользователя
+    и рецепты популярных авторов, на которых он подписан. Каждый поток
+    читается по индексу не дальше limit строк. Возвращает ключи страницы
+    и признак того, что дальше есть ещё рецепты.
+    """
+    popular_ids = list(User.objects.filter(
+        following__user=user,
+        followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('id', flat=True))
+    streams = [list(pushed_keys(user, cursor, limit))]
+    if popular_ids:
+        pulled = Recipe.objects.filter(
+            before(cursor, 'created_ts', 'id'), author__in=popular_ids
+        ).order_by('-created_ts', '-id').values_list(
+            'created_ts', 'id')[:limit]
+        streams.append(list(pulled))
+
+    keys = []
+    # автор мог стать популярным после рассылки - дубликаты идут подряд
+    for key in heapq.merge(*streams, reverse=True):
+        if not keys or keys[-1] != key:
+            keys.append(key)
+    has_more = any(len(stream) == limit for stream in streams)
+    return keys[:limit], has_more or len(keys) > limit
@@ -0,0 +1,92 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANT_SIZES = {
+    'small': (320, 320),
+    'medium': (960, 960),
+}
+VARIANT_FORMATS = {'jpeg': 'jpg'}
+if features.check('webp'):
+    VARIANT_FORMATS['webp'] = 'webp'
+VARIANTS_DIR = 'recipes/images/variants'
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS, thread_name_prefix='image-variants'
+)
+
+
+def save_variant(image, stem, size, image_format, extension):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format.upper(), quality=80)
+    name = f'{VARIANTS_DIR}/{stem}_{size}.{extension}'
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def build_variants(recipe_id):
+    """Создание уменьшенных копий картинки рецепта."""
+    try:
+        recipe = Recipe.objects.only('image').get(pk=recipe_id)
+        with recipe.image.open('rb') as image_file:
+            original = ImageOps.exif_transpose(Image.open(image_file))
+            original = original.convert('RGB')
+        stem = os.path.splitext(os.path.basename(recipe.image.name))[0]
+        variants = {}
+        for size, box in VARIANT_SIZES.items():
+            image = original.copy()
+            image.thumbnail(box)
+            variants[size] = {
+                image_format: save_variant(
+                    image, stem, size, image_format, extension)
+                for image_format, extension in VARIANT_FORMATS.items()
+            }
+        # картинку могли заменить или удалить рецепт, пока шла обработка
+        updated = Recipe.objects.filter(
+            pk=recipe_id, image=recipe.image.name).update(
+                image_variants=variants)
+        if not updated:
+            delete_variants(variants)
+    except Recipe.DoesNotExist:
+        pass
+    except Exception:
+        logger.exception('Image variants for recipe %s failed', recipe_id)
+
+
+def build_variants_in_pool(recipe_id):
+    try:
+        build_variants(recipe_id)
+    finally:
+        # у потока пула своё соединение, иначе оно останется открытым
+        connection.close()
+
+
+def schedule_variants(recipe):
+    """Постановка обработки картинки в очередь после фиксации транзакции."""
+    transaction.on_commit(
+        lambda: executor.submit(build_variants_in_pool, recipe.pk))
+
+
+def delete_variants(variants):
+    """Удаление файлов уменьшенных копий (значение image_variants)."""
+    for formats in variants.values():
+        for name in formats.values():
+            default_storage.delete(name)
+
+
+def schedule_variants_cleanup(variants):
+    """Удаление копий после фиксации: при откате они ещё нужны."""
+    if variants:
+        transaction.on_commit(lambda: delete_variants(variants))
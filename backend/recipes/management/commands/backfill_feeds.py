@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.feed import BACKFILL_RECIPES, backfill_feed
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Заполнение лент подписок последними рецептами авторов: после '
+            'появления лент, массового импорта подписок или смены порога '
+            'FEED_FANOUT_MAX_FOLLOWERS. Повторный запуск безопасен.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            help='id пользователя; можно указать несколько.')
+        parser.add_argument('--recipes', type=int, default=BACKFILL_RECIPES,
+                            help='Сколько последних рецептов каждого автора.')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(follower__isnull=False).distinct()
+        if options['user']:
+            users = users.filter(pk__in=options['user'])
+        total = 0
+        for user in users.order_by('pk').iterator():
+            with transaction.atomic():
+                total += backfill_feed(
+                    user, User.objects.filter(following__user=user),
+                    options['recipes'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей добавлено или уже было в лентах: {total}'))
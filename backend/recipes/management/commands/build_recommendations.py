@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import RecipeSignalState, RecipeSimilarity
+from recipes.recommendations import (build_matrix, co_occurring,
+                                     column_fingerprints, column_norms,
+                                     top_neighbours)
+
+
+class Command(BaseCommand):
+    help = ('Расчёт похожих рецептов по совместным добавлениям в избранное '
+            'и корзину. По умолчанию пересчитываются только рецепты, у '
+            'которых изменились избранное или корзины, и их соседи.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=20)
+        parser.add_argument('--block-size', type=int, default=1000,
+                            help='Столбцов X^T X за один шаг.')
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать все рецепты.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        matrix, user_ids, recipe_ids = build_matrix()
+        self.stdout.write(
+            f'Сигналов: {matrix.nnz}, пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}')
+
+        if not matrix.nnz:
+            RecipeSimilarity.objects.all().delete()
+            RecipeSignalState.objects.all().delete()
+            self.stdout.write('Нет сигналов - рекомендации очищены.')
+            return
+
+        fingerprints = column_fingerprints(matrix, user_ids)
+        recipe_list = recipe_ids.tolist()
+        stored = dict(RecipeSignalState.objects.values_list(
+            'recipe_id', 'fingerprint'))
+        if options['full']:
+            changed = np.arange(len(recipe_ids))
+        else:
+            changed = np.array([
+                column for column, (recipe_id, fingerprint) in enumerate(
+                    zip(recipe_list, fingerprints.tolist()))
+                if stored.get(recipe_id) != fingerprint
+            ], dtype=np.int64)
+        # рецепты, которые совсем перестали добавлять
+        dropped = stored.keys() - set(recipe_list)
+        changed_ids = recipe_ids[changed].tolist()
+
+        affected = co_occurring(matrix, changed) if len(changed) else changed
+        # соседи могли потерять общих пользователей с изменившимися
+        # рецептами - такие связи видны только в сохранённых результатах
+        stale = set(RecipeSimilarity.objects.filter(
+            similar_recipe__in=[*changed_ids, *dropped]).values_list(
+                'recipe_id', flat=True))
+        columns = {recipe_id: column
+                   for column, recipe_id in enumerate(recipe_list)}
+        stale_columns = [columns[recipe_id] for recipe_id in stale
+                         if recipe_id in columns]
+        affected = np.union1d(affected, np.array(stale_columns, np.int64))
+        dropped |= stale - columns.keys()
+
+        with transaction.atomic():
+            RecipeSimilarity.objects.filter(recipe__in=dropped).delete()
+            RecipeSignalState.objects.filter(recipe__in=dropped).delete()
+
+        norms = column_norms(matrix)
+        block_size = options['block_size']
+        saved = 0
+        for start in range(0, len(affected), block_size):
+            block = affected[start:start + block_size]
+            similarities = [
+                RecipeSimilarity(recipe_id=recipe_list[column],
+                                 similar_recipe_id=recipe_list[neighbour],
+                                 score=score)
+                for column, neighbours, scores in top_neighbours(
+                    matrix, norms, block, options['top_k'])
+                for neighbour, score in zip(neighbours.tolist(),
+                                            scores.tolist())
+            ]
+            with transaction.atomic():
+                RecipeSimilarity.objects.filter(
+                    recipe__in=recipe_ids[block].tolist()).delete()
+                RecipeSimilarity.objects.bulk_create(
+                    similarities, batch_size=5000)
+            saved += len(similarities)
+
+        with transaction.atomic():
+            RecipeSignalState.objects.filter(recipe__in=changed_ids).delete()
+            RecipeSignalState.objects.bulk_create(
+                (RecipeSignalState(recipe_id=recipe_id,
+                                   fingerprint=fingerprint)
+                 for recipe_id, fingerprint in zip(
+                     changed_ids, fingerprints[changed].tolist())),
+                batch_size=5000
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Изменилось рецептов: {len(changed)}, пересчитано: '
+            f'{len(affected)}, удалено: {len(dropped)}, связей записано: '
+            f'{saved}, время: {time.monotonic() - started:.1f} с'))
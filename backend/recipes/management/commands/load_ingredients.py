@@ -0,0 +1,92 @@
+import csv
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.cache import bump_version
+from recipes.models import Ingredient
+
+DEFAULT_FILE = os.path.join(
+    os.path.dirname(settings.BASE_DIR), 'data', 'ingredients.csv')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    # стандартный json не умеет потоковый разбор - файл читается целиком
+    for item in json.load(file):
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+class Command(BaseCommand):
+    help = ('Загрузка каталога ингредиентов из CSV или JSON. Уже '
+            'существующие пары (название, единица измерения) пропускаются, '
+            'поэтому команду можно запускать повторно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_FILE)
+        parser.add_argument('--format', choices=READERS,
+                            help='По умолчанию - по расширению файла.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Показать, какие ингредиенты будут добавлены, без записи.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1][1:]
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+
+        existing = set(Ingredient.objects.values_list(
+            'name', 'measurement_unit').iterator())
+        in_file, batch = set(), []
+        created = skipped = 0
+        try:
+            with open(path, encoding='utf-8', newline='') as file, \
+                    transaction.atomic():
+                for name, unit in READERS[file_format](file):
+                    pair = (name.strip(), unit.strip())
+                    is_new = (all(pair) and pair not in in_file
+                              and pair not in existing)
+                    in_file.add(pair)
+                    if not is_new:
+                        skipped += 1
+                        continue
+                    created += 1
+                    if options['dry_run']:
+                        self.stdout.write(f'+ {pair[0]} ({pair[1]})')
+                        continue
+                    batch.append(
+                        Ingredient(name=pair[0], measurement_unit=pair[1]))
+                    if len(batch) >= options['batch_size']:
+                        self.save(batch)
+                        batch = []
+                self.save(batch)
+        except FileNotFoundError:
+            raise CommandError(f'Файл {path} не найден.')
+
+        if options['dry_run']:
+            missing = len(existing - in_file)
+            self.stdout.write(
+                f'Будет добавлено: {created}, пропущено: {skipped}, '
+                f'есть только в БД: {missing}')
+            return
+        if created:
+            bump_version(Ingredient._meta.label_lower)
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {created}, пропущено: {skipped}'))
+
+    def save(self, batch):
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
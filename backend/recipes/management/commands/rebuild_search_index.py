@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.search import BATCH_SIZE, update_search_index_in_batches
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт поискового индекса рецептов (tsvector в PostgreSQL, '
+            'таблица токенов в остальных СУБД).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = update_search_index_in_batches(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True),
+            options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {count}'))
@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from recipes.models import (IngredientInRecipe, Recipe, ShoppingCart,
+                            count_by)
+from users.models import Follow
+
+User = get_user_model()
+
+
+def get_counters():
+    favorites = User.favorites.through.objects
+    return (
+        (Recipe, 'favorites_count', count_by(favorites, 'recipe')),
+        (Recipe, 'in_carts_count', count_by(ShoppingCart.objects, 'recipe')),
+        (Recipe, 'ingredients_count',
+         count_by(IngredientInRecipe.objects, 'recipe')),
+        (User, 'recipes_count', count_by(Recipe.objects, 'author')),
+        (User, 'followers_count', count_by(Follow.objects, 'author')),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт денормализованных счётчиков рецептов и пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать число записей с расхождениями.'
+        )
+
+    def handle(self, *args, **options):
+        for model, field, actual in get_counters():
+            drifted = model.objects.annotate(actual=actual).exclude(
+                **{field: F('actual')}).count()
+            self.stdout.write(
+                f'{model._meta.label}.{field}: расхождений {drifted}')
+            if drifted and not options['dry_run']:
+                with transaction.atomic():
+                    model.objects.update(**{field: actual})
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны.'))
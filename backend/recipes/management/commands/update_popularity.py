@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.models import RecipeEvent
+from recipes.popularity import (Period, apply_increments, decay_scores,
+                                fold_events)
+
+
+class Command(BaseCommand):
+    help = ('Учёт накопленных событий (избранное, корзина) в оценках '
+            'популярности с затуханием. Запускается периодически, '
+            'например раз в 10 минут.')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        last_id = RecipeEvent.objects.aggregate(
+            last_id=Max('id'))['last_id']
+        # события, записанные во время пересчёта, попадут в следующий
+        events = RecipeEvent.objects.filter(id__lte=last_id or 0)
+        with transaction.atomic():
+            for period in Period:
+                decay_scores(period, now)
+            increments = fold_events(events.values_list(
+                'recipe_id', 'kind', 'created_ts').iterator(), now)
+            for period, scores in increments.items():
+                apply_increments(period, scores, now)
+            folded = events.delete()[0]
+        self.stdout.write(self.style.SUCCESS(
+            f'Учтено событий: {folded}'))
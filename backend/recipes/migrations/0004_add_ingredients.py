@@ -27,17 +27,16 @@ def get_ingredients():
 
 def add_ingredients(apps, schema_editor):
     Ingredient = apps.get_model('recipes', 'Ingredient')
-    ingredients = get_ingredients()
-    for ingredient in ingredients:
-        new_item = Ingredient(**ingredient)
-        new_item.save()
+    Ingredient.objects.bulk_create(
+        (Ingredient(**ingredient) for ingredient in get_ingredients()),
+        batch_size=1000
+    )
 
 
 def remove_ingredients(apps, schema_editor):
     Ingredient = apps.get_model('recipes', 'Ingredient')
-    ingredients = get_ingredients()
-    for ingredient in ingredients:
-        Ingredient.objects.get(name=ingredient['name']).delete()
+    names = [ingredient['name'] for ingredient in get_ingredients()]
+    Ingredient.objects.filter(name__in=names).delete()
 
 
 class Migration(migrations.Migration):
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+# Django 3.2 не умеет задавать opclass для индекса по выражению,
+# поэтому индексы создаются вручную с учётом СУБД.
+POSTGRESQL_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm;',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_prefix '
+    'ON recipes_ingredient (UPPER(name) varchar_pattern_ops);',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name) gin_trgm_ops);',
+]
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS recipes_ingredient_name_upper_prefix;',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_upper_trgm;',
+]
+SQLITE_FORWARD = [
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_nocase '
+    'ON recipes_ingredient (name COLLATE NOCASE);',
+]
+SQLITE_BACKWARD = [
+    'DROP INDEX IF EXISTS recipes_ingredient_name_nocase;',
+]
+
+
+def run_statements(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def add_name_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run_statements(schema_editor, POSTGRESQL_FORWARD)
+    elif vendor == 'sqlite':
+        run_statements(schema_editor, SQLITE_FORWARD)
+
+
+def remove_name_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run_statements(schema_editor, POSTGRESQL_BACKWARD)
+    elif vendor == 'sqlite':
+        run_statements(schema_editor, SQLITE_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_add_ingredients'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_name_indexes, remove_name_indexes)
+    ]
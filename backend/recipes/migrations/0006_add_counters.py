@@ -0,0 +1,96 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:44
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# верхняя граница PositiveSmallIntegerField
+MAX_AMOUNT = 32767
+
+
+def duplicate_groups(queryset, fields):
+    """Значения fields, которые встречаются в queryset больше одного раза."""
+    return queryset.values(*fields).annotate(copies=Count('pk')).filter(
+        copies__gt=1).values_list(*fields)
+
+
+def merge_duplicates(apps, schema_editor):
+    """Удаление повторов перед уникальными ограничениями.
+
+    Раньше строки добавлялись после проверки на существование, и
+    параллельные запросы могли вставить их дважды. Остаётся строка с
+    наименьшим id; количества ингредиента в рецепте складываются.
+    """
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+
+    for recipe_id, user_id in duplicate_groups(
+            ShoppingCart.objects, ('recipe', 'user')):
+        rows = ShoppingCart.objects.filter(recipe=recipe_id, user=user_id)
+        kept_id = rows.order_by('pk').values_list('pk', flat=True)[0]
+        rows.exclude(pk=kept_id).delete()
+
+    lines_by_key = defaultdict(list)
+    for recipe_id, ingredient_id in duplicate_groups(
+            IngredientInRecipe.objects, ('recipe', 'ingredient')):
+        for line in IngredientInRecipe.objects.filter(
+                recipe=recipe_id, ingredient=ingredient_id).order_by('pk'):
+            lines_by_key[recipe_id, ingredient_id].append(line)
+    kept_lines, extra_ids = [], []
+    for lines in lines_by_key.values():
+        kept, *extra = lines
+        kept.amount = min(sum(line.amount for line in lines), MAX_AMOUNT)
+        kept_lines.append(kept)
+        extra_ids.extend(line.pk for line in extra)
+    IngredientInRecipe.objects.filter(pk__in=extra_ids).delete()
+    IngredientInRecipe.objects.bulk_update(kept_lines, ['amount'])
+
+
+def count_by(queryset, field):
+    subquery = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(subquery), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    User = apps.get_model('users', 'User')
+    Favorite = User._meta.get_field('favorites').remote_field.through
+    Recipe.objects.update(
+        favorites_count=count_by(Favorite.objects, 'recipe'),
+        in_carts_count=count_by(ShoppingCart.objects, 'recipe'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_ingredient_name_indexes'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число добавлений в список покупок'),
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredientinrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredients'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('recipe', 'user'), name='unique_cart_recipes'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
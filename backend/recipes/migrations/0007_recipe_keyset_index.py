@@ -0,0 +1,21 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_add_counters'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recipe',
+            options={'ordering': ('-created_ts', '-id'), 'verbose_name': 'рецепт', 'verbose_name_plural': 'Рецепты'},
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-created_ts', '-id'], name='recipe_created_ts_id_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:49
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+# верхняя граница PositiveSmallIntegerField
+MAX_AMOUNT = 32767
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Слияние одинаковых ингредиентов перед уникальным ограничением.
+
+    Остаётся ингредиент с наименьшим id; строки рецептов переносятся на
+    него, а если в рецепте были оба - количества складываются.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    groups = Ingredient.objects.values('name', 'measurement_unit').annotate(
+        copies=Count('pk'), survivor_id=Min('pk')).filter(copies__gt=1)
+    for group in groups:
+        survivor_id = group['survivor_id']
+        duplicate_ids = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(pk=survivor_id).values_list('pk', flat=True))
+
+        lines_by_recipe = defaultdict(list)
+        for line in IngredientInRecipe.objects.filter(
+                ingredient__in=[survivor_id, *duplicate_ids]).order_by(
+                    'pk'):
+            lines_by_recipe[line.recipe_id].append(line)
+        kept_lines, extra_ids = [], []
+        for lines in lines_by_recipe.values():
+            kept, *extra = lines
+            kept.ingredient_id = survivor_id
+            kept.amount = min(sum(line.amount for line in lines), MAX_AMOUNT)
+            kept_lines.append(kept)
+            extra_ids.extend(line.pk for line in extra)
+        # сначала удаление: (recipe, ingredient) уже уникальны
+        IngredientInRecipe.objects.filter(pk__in=extra_ids).delete()
+        IngredientInRecipe.objects.bulk_update(
+            kept_lines, ['ingredient', 'amount'])
+        Ingredient.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_unit'),
+        ),
+    ]
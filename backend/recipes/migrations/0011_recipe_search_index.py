@@ -0,0 +1,74 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# столбец tsvector нужен только в PostgreSQL и не описан в модели:
+# с ним работает recipes.search через SQL. Существующие рецепты
+# индексируются здесь же (копия recipes.search.POSTGRESQL_UPDATE на момент
+# миграции); таблицу токенов в остальных СУБД заполняет команда
+# rebuild_search_index.
+POSTGRESQL_FORWARD = [
+    'ALTER TABLE recipes_recipe '
+    'ADD COLUMN IF NOT EXISTS search_vector tsvector;',
+    '''
+    UPDATE recipes_recipe SET search_vector =
+        setweight(to_tsvector('russian', name), 'A') ||
+        setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_ingredientinrecipe line
+            JOIN recipes_ingredient ingredient
+                ON ingredient.id = line.ingredient_id
+            WHERE line.recipe_id = recipes_recipe.id
+        ), '')), 'B') ||
+        setweight(to_tsvector('russian', text), 'C');
+    ''',
+    # индекс строится после заполнения: так быстрее, чем обновлять его
+    # на каждой строке
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_gin '
+    'ON recipes_recipe USING gin (search_vector);',
+]
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin;',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector;',
+]
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRESQL_FORWARD:
+            schema_editor.execute(statement)
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRESQL_BACKWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_unique_ingredient_unit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=50)),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('recipe', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='recipes.recipe')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recipesearchtoken',
+            index=models.Index(fields=['token', 'recipe'], name='search_token_recipe_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipesearchtoken',
+            constraint=models.UniqueConstraint(fields=('recipe', 'token'), name='unique_recipe_token'),
+        ),
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
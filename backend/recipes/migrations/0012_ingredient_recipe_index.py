@@ -0,0 +1,35 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:59
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_ingredients_count(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    subquery = IngredientInRecipe.objects.filter(
+        recipe=OuterRef('pk')).order_by().values('recipe').annotate(
+            total=Count('pk')).values('total')
+    Recipe.objects.update(ingredients_count=Coalesce(Subquery(subquery), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredientinrecipe',
+            index=models.Index(fields=['ingredient', 'recipe'], name='line_ingredient_recipe_idx'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Число ингредиентов'),
+        ),
+        migrations.RunPython(
+            fill_ingredients_count, migrations.RunPython.noop),
+    ]
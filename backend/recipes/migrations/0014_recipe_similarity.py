@@ -0,0 +1,38 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_feed_items'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSignalState',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signal_state', serialize=False, to='recipes.recipe')),
+                ('fingerprint', models.BigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecipeSimilarity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('recipe', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='recipes.recipe')),
+                ('similar_recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recipesimilarity',
+            index=models.Index(fields=['recipe', '-score'], name='similarity_recipe_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipesimilarity',
+            constraint=models.UniqueConstraint(fields=('recipe', 'similar_recipe'), name='unique_similar_recipe'),
+        ),
+    ]
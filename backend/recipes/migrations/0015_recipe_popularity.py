@@ -0,0 +1,41 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipePopularity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hot', 'Сейчас (полураспад 6 часов)'), ('trending', 'В тренде (полураспад 2 дня)'), ('steady', 'Стабильно (полураспад 7 дней)'), ('all', 'Всё время (без затухания)')], max_length=10)),
+                ('score', models.FloatField()),
+                ('updated_ts', models.DateTimeField()),
+                ('recipe', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='popularity', to='recipes.recipe')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecipeEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Избранное'), (2, 'Список покупок')])),
+                ('created_ts', models.DateTimeField(auto_now_add=True)),
+                ('recipe', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recipepopularity',
+            index=models.Index(fields=['period', '-score', '-recipe'], name='popularity_period_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipepopularity',
+            constraint=models.UniqueConstraint(fields=('recipe', 'period'), name='unique_recipe_period'),
+        ),
+    ]
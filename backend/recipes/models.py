@@ -1,7 +1,11 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinLengthValidator, MinValueValidator
 from django.db import models
-from django.db.models import Exists, OuterRef, Value
+from django.db.models import (Count, Exists, ExpressionWrapper, F, OuterRef,
+                              Prefetch, Subquery, Value, Window)
+from django.db.models.functions import Cast, Coalesce, Greatest, RowNumber
+
+from users.models import Follow
 
 User = get_user_model()
 
@@ -38,11 +42,44 @@ class Ingredient(models.Model):
         ordering = ('name', )
         verbose_name = 'ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit')
+        ]
 
     def __str__(self):
         return f'{self.name[:50]}, {self.measurement_unit[:10]}'
 
 
+def ingredient_lines_prefetch():
+    """Строки состава рецепта вместе с ингредиентами."""
+    return Prefetch(
+        'ingredientinrecipe_set',
+        queryset=IngredientInRecipe.objects.select_related('ingredient')
+    )
+
+
+def count_by(queryset, field):
+    """Подзапрос с числом строк queryset, ссылающихся на внешнюю запись."""
+    subquery = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(subquery), 0)
+
+
+def shift_counter(queryset, field, delta):
+    """Атомарное изменение денормализованного счётчика через F().
+
+    Счётчик не опускается ниже нуля, даже если успел разойтись с данными.
+    """
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def change_counter(model, pk, field, delta):
+    """Изменение счётчика одной записи."""
+    return shift_counter(model.objects.filter(pk=pk), field, delta)
+
+
 class CustomRecipeQueryset(models.QuerySet):
     """Переопредение queryset-а для рецептов и аннотация доп. полями."""
     def with_annotations(self, user):
@@ -53,7 +90,8 @@ class CustomRecipeQueryset(models.QuerySet):
 
         new_queryset = self.annotate(
             is_favorited=Exists(
-                user.favorites.filter(id=OuterRef('pk'))
+                User.favorites.through.objects.filter(
+                    user=user, recipe=OuterRef('pk'))
             ),
             is_in_shopping_cart=Exists(
                 ShoppingCart.objects.filter(
@@ -62,6 +100,63 @@ class CustomRecipeQueryset(models.QuerySet):
         )
         return new_queryset
 
+    def for_listing(self, user):
+        """Загрузка страницы рецептов за фиксированное число запросов."""
+        if user.is_authenticated:
+            is_subscribed = Exists(
+                Follow.objects.filter(user=user, author=OuterRef('author'))
+            )
+        else:
+            is_subscribed = Value(False, models.BooleanField())
+        return self.with_annotations(user).annotate(
+            author_is_subscribed=is_subscribed
+        ).select_related('author').prefetch_related(
+            'tags', ingredient_lines_prefetch()
+        )
+
+    def match_ingredients(self, ingredient_ids):
+        """Рецепты хотя бы с одним из ингредиентов и оценка совпадения.
+
+        matched_count - сколько ингредиентов рецепта есть в списке,
+        ingredients_count - сколько их всего (хранится в рецепте),
+        coverage - доля имеющихся. Совпадения считает одна группировка
+        строк состава, отобранных по индексу (ingredient, recipe).
+        """
+        # distinct: соединения из фильтров списка (поиск) размножают строки
+        return self.filter(
+            ingredientinrecipe__ingredient__in=ingredient_ids
+        ).annotate(
+            matched_count=Count('ingredientinrecipe', distinct=True),
+        ).annotate(
+            # счётчик мог отстать от состава - доля не больше единицы
+            coverage=ExpressionWrapper(
+                Cast('matched_count', models.FloatField())
+                / Greatest('ingredients_count', 'matched_count'),
+                output_field=models.FloatField()
+            ),
+        )
+
+    def latest_by_authors(self, author_ids, limit):
+        """Последние limit рецептов каждого автора одним запросом.
+
+        Django 3.2 не умеет фильтровать по оконной функции, поэтому
+        ранжирующий запрос оборачивается в raw-подзапрос.
+        """
+        ranked = self.filter(author_id__in=author_ids).order_by().annotate(
+            recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('created_ts').desc(), F('id').desc()]
+            )
+        ).values('id', 'name', 'image', 'image_variants', 'cooking_time',
+                 'author_id', 'recipe_rank')
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE recipe_rank <= %s '
+            f'ORDER BY author_id, recipe_rank',
+            (*params, limit)
+        )
+
 
 class Recipe(models.Model):
     """Класс для хранения рецептов."""
@@ -70,6 +165,8 @@ class Recipe(models.Model):
     text = models.TextField('Текст рецепта')
     image = models.ImageField(
         'Картинка к рецепту', upload_to='recipes/images')
+    image_variants = models.JSONField(
+        'Уменьшенные копии картинки', default=dict, editable=False)
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления в минутах', validators=[MinValueValidator(1)])
     author = models.ForeignKey(
@@ -88,13 +185,25 @@ class Recipe(models.Model):
         through='IngredientInRecipe',
         verbose_name='Ингредиенты'
     )
+    favorites_count = models.PositiveIntegerField(
+        'Число добавлений в избранное', default=0, editable=False)
+    in_carts_count = models.PositiveIntegerField(
+        'Число добавлений в список покупок', default=0, editable=False)
+    ingredients_count = models.PositiveSmallIntegerField(
+        'Число ингредиентов', default=0, editable=False)
 
     objects = CustomRecipeQueryset.as_manager()
 
     class Meta():
         verbose_name_plural = 'Рецепты'
         verbose_name = 'рецепт'
-        ordering = ('-created_ts', )
+        ordering = ('-created_ts', '-id')
+        indexes = [
+            models.Index(fields=['-created_ts', '-id'],
+                         name='recipe_created_ts_id_idx'),
+            models.Index(fields=['author', '-created_ts', '-id'],
+                         name='recipe_author_created_ts_idx'),
+        ]
 
     def __str__(self):
         return self.name[:50] + ' by User ' + self.author.username
@@ -112,6 +221,10 @@ class IngredientInRecipe(models.Model):
                 fields=['recipe', 'ingredient'],
                 name='unique_recipe_ingredients')
         ]
+        indexes = [
+            models.Index(fields=['ingredient', 'recipe'],
+                         name='line_ingredient_recipe_idx'),
+        ]
 
 
 class ShoppingCart(models.Model):
@@ -125,3 +238,141 @@ class ShoppingCart(models.Model):
                 fields=['recipe', 'user'],
                 name='unique_cart_recipes')
         ]
+        indexes = [
+            models.Index(fields=['user', 'recipe'],
+                         name='cart_user_recipe_idx'),
+        ]
+
+
+class RecipeSearchToken(models.Model):
+    """Поисковый индекс рецептов для СУБД без полнотекстового поиска.
+
+    В PostgreSQL вместо него используется столбец tsvector
+    (см. recipes.search).
+    """
+    # поиск по рецепту покрывает уникальный индекс (recipe, token)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='search_tokens', db_index=False)
+    token = models.CharField(max_length=50)
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta():
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'token'], name='unique_recipe_token')
+        ]
+        indexes = [
+            models.Index(fields=['token', 'recipe'],
+                         name='search_token_recipe_idx'),
+        ]
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписчика: записывается при публикации рецепта.
+
+    Для популярных авторов записи не создаются - их рецепты читаются
+    при запросе ленты (см. recipes.feed).
+    """
+    # выборка по пользователю покрыта индексами ниже
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='feed_items', db_index=False)
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='feed_items')
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+')
+    created_ts = models.DateTimeField()
+
+    class Meta():
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_feed_recipe')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_ts', '-recipe'],
+                         name='feed_user_created_ts_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+
+class RecipeSimilarity(models.Model):
+    """Похожие рецепты: top-K соседей по совместным добавлениям.
+
+    Заполняется командой build_recommendations.
+    """
+    # выборка по рецепту покрыта индексом (recipe, -score)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='similarities', db_index=False)
+    similar_recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta():
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar_recipe'],
+                name='unique_similar_recipe')
+        ]
+        indexes = [
+            models.Index(fields=['recipe', '-score'],
+                         name='similarity_recipe_score_idx'),
+        ]
+
+
+class RecipeSignalState(models.Model):
+    """Отпечаток множества пользователей, добавивших рецепт.
+
+    По нему build_recommendations находит рецепты, у которых изменились
+    избранное или корзины, и пересчитывает только их.
+    """
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE, primary_key=True,
+        related_name='signal_state')
+    fingerprint = models.BigIntegerField()
+
+
+class RecipeEvent(models.Model):
+    """Добавление рецепта в избранное или корзину.
+
+    События копятся между запусками update_popularity и удаляются, как
+    только учтены в RecipePopularity.
+    """
+    class Kind(models.IntegerChoices):
+        FAVORITE = 1, 'Избранное'
+        CART = 2, 'Список покупок'
+
+    # события читаются только целиком по возрастанию id - индекс не нужен
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='+', db_index=False)
+    kind = models.PositiveSmallIntegerField(choices=Kind.choices)
+    created_ts = models.DateTimeField(auto_now_add=True)
+
+
+class RecipePopularity(models.Model):
+    """Популярность рецепта: сумма событий с затуханием.
+
+    Оценки отличаются периодом полураспада, а не окном: старые события
+    учитываются всегда, но с меньшим весом.
+    """
+    class Period(models.TextChoices):
+        HOT = 'hot', 'Сейчас (полураспад 6 часов)'
+        TRENDING = 'trending', 'В тренде (полураспад 2 дня)'
+        STEADY = 'steady', 'Стабильно (полураспад 7 дней)'
+        ALL = 'all', 'Всё время (без затухания)'
+
+    # выборка по рецепту покрыта уникальным индексом (recipe, period)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='popularity', db_index=False)
+    period = models.CharField(max_length=10, choices=Period.choices)
+    score = models.FloatField()
+    updated_ts = models.DateTimeField()
+
+    class Meta():
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'period'], name='unique_recipe_period')
+        ]
+        indexes = [
+            models.Index(fields=['period', '-score', '-recipe'],
+                         name='popularity_period_score_idx'),
+        ]
@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from django.db.models import F, Max
+
+from .models import RecipeEvent, RecipePopularity
+
+Period = RecipePopularity.Period
+
+EVENT_WEIGHTS = {
+    RecipeEvent.Kind.FAVORITE: 1.0,
+    RecipeEvent.Kind.CART: 0.5,
+}
+# за период полураспада вклад события уменьшается вдвое
+HALF_LIVES = {
+    Period.HOT: timedelta(hours=6),
+    Period.TRENDING: timedelta(days=2),
+    Period.STEADY: timedelta(days=7),
+    Period.ALL: None,
+}
+DEFAULT_PERIOD = Period.TRENDING
+# затухшие ниже порога оценки удаляются, чтобы таблица не росла
+MIN_SCORE = 0.01
+
+
+def record_events(kind, recipe_ids):
+    """Запись событий для пересчёта популярности."""
+    RecipeEvent.objects.bulk_create(
+        RecipeEvent(recipe_id=recipe_id, kind=kind)
+        for recipe_id in recipe_ids
+    )
+
+
+def decay_factor(elapsed, half_life):
+    if half_life is None:
+        return 1.0
+    return 0.5 ** (elapsed / half_life)
+
+
+def decay_scores(period, now):
+    """Затухание всех оценок периода с момента прошлого пересчёта.
+
+    Пересчёт обновляет все строки периода разом, поэтому время прошлого
+    пересчёта у них общее.
+    """
+    half_life = HALF_LIVES[period]
+    scores = RecipePopularity.objects.filter(period=period)
+    last_run = scores.aggregate(last_run=Max('updated_ts'))['last_run']
+    if half_life is None or last_run is None:
+        return
+    scores.update(score=F('score') * decay_factor(now - last_run, half_life),
+                  updated_ts=now)
+    scores.filter(score__lt=MIN_SCORE).delete()
+
+
+def fold_events(events, now):
+    """Прибавка к оценкам от событий: {период: {recipe_id: вклад}}."""
+    increments = {period: {} for period in Period}
+    for recipe_id, kind, created_ts in events:
+        for period, half_life in HALF_LIVES.items():
+            weight = EVENT_WEIGHTS[kind] * decay_factor(
+                now - created_ts, half_life)
+            scores = increments[period]
+            scores[recipe_id] = scores.get(recipe_id, 0.0) + weight
+    return increments
+
+
+def apply_increments(period, increments, now):
+    """Прибавка к оценкам периода; новые рецепты получают строку."""
+    existing = {
+        popularity.recipe_id: popularity
+        for popularity in RecipePopularity.objects.filter(
+            period=period, recipe__in=list(increments))
+    }
+    to_update, to_create = [], []
+    for recipe_id, increment in increments.items():
+        popularity = existing.get(recipe_id)
+        if popularity is None:
+            if increment < MIN_SCORE:
+                continue
+            to_create.append(RecipePopularity(
+                recipe_id=recipe_id, period=period, score=increment,
+                updated_ts=now))
+        else:
+            popularity.score += increment
+            popularity.updated_ts = now
+            to_update.append(popularity)
+    RecipePopularity.objects.bulk_update(
+        to_update, ['score', 'updated_ts'], batch_size=1000)
+    RecipePopularity.objects.bulk_create(to_create, batch_size=1000)
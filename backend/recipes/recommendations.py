@@ -0,0 +1,93 @@
+"""Рекомендации по совместным добавлениям в избранное и корзину.
+
+Рецепт - столбец разреженной матрицы пользователи x рецепты, близость
+рецептов - косинус между столбцами. X^T X считается блоками столбцов,
+поэтому память ограничена размером блока, а не квадратом каталога.
+"""
+from itertools import chain
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from scipy import sparse
+
+from .models import ShoppingCart
+
+User = get_user_model()
+
+FAVORITE_WEIGHT = 1.0
+CART_WEIGHT = 0.5
+CHUNK_SIZE = 100000
+# множитель Фибоначчи-хеширования и второй - для веса сигнала
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+WEIGHT_MULTIPLIER = np.uint64(0xC2B2AE3D27D4EB4F)
+
+
+def load_pairs(queryset):
+    """Пары (user_id, recipe_id) в массиве numpy, без моделей Django."""
+    rows = queryset.order_by().values_list('user_id', 'recipe_id').iterator(
+        chunk_size=CHUNK_SIZE)
+    return np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(
+        -1, 2)
+
+
+def build_matrix():
+    """Матрица пользователи x рецепты (CSC) с весами сигналов.
+
+    Возвращает матрицу и id пользователей и рецептов для её строк
+    и столбцов. Рецепт и в избранном, и в корзине получает сумму весов.
+    """
+    favorites = load_pairs(User.favorites.through.objects)
+    carts = load_pairs(ShoppingCart.objects)
+    pairs = np.concatenate([favorites, carts])
+    weights = np.concatenate([
+        np.full(len(favorites), FAVORITE_WEIGHT, dtype=np.float32),
+        np.full(len(carts), CART_WEIGHT, dtype=np.float32),
+    ])
+    user_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    recipe_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csc_matrix(
+        (weights, (rows, columns)), shape=(len(user_ids), len(recipe_ids)))
+    matrix.sum_duplicates()
+    return matrix, user_ids, recipe_ids
+
+
+def column_fingerprints(matrix, user_ids):
+    """Отпечатки столбцов: сумма хешей (пользователь, вес) по модулю 2^64.
+
+    Сумма не зависит от порядка строк, поэтому сравнима между запусками.
+    В матрице нет пустых столбцов - рецепты взяты из самих сигналов.
+    """
+    hashes = user_ids[matrix.indices].astype(np.uint64) * HASH_MULTIPLIER
+    hashes ^= hashes >> np.uint64(29)
+    codes = np.rint(matrix.data * 2).astype(np.uint64)
+    hashes += codes * WEIGHT_MULTIPLIER
+    fingerprints = np.add.reduceat(hashes, matrix.indptr[:-1])
+    return fingerprints.view(np.int64)
+
+
+def column_norms(matrix):
+    return np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+
+
+def co_occurring(matrix, columns):
+    """Столбцы, у которых есть общие пользователи со столбцами columns."""
+    users = np.unique(matrix[:, columns].indices)
+    return np.unique(matrix.tocsr()[users].indices)
+
+
+def top_neighbours(matrix, norms, columns, top_k):
+    """Top-K соседей по косинусной близости для блока столбцов.
+
+    Выдаёт (столбец, столбцы соседей, оценки) для каждого из columns.
+    """
+    gram = (matrix.T @ matrix[:, columns]).tocsc()
+    for position, column in enumerate(columns):
+        start, end = gram.indptr[position], gram.indptr[position + 1]
+        neighbours = gram.indices[start:end]
+        scores = gram.data[start:end] / (norms[neighbours] * norms[column])
+        other = neighbours != column
+        neighbours, scores = neighbours[other], scores[other]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            neighbours, scores = neighbours[best], scores[best]
+        yield column, neighbours, scores
@@ -0,0 +1,157 @@
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.db.models import (BooleanField, FloatField, OuterRef, Q, Subquery,
+                              Sum)
+from django.db.models.expressions import RawSQL
+
+from .models import IngredientInRecipe, Recipe, RecipeSearchToken
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = 'russian'
+BATCH_SIZE = 1000
+MAX_TERMS = 8
+TOKEN_LENGTH = RecipeSearchToken._meta.get_field('token').max_length
+# веса полей для запасного индекса: название важнее состава, состав - текста
+TOKEN_WEIGHTS = {'name': 3, 'ingredients': 2, 'text': 1}
+WORD_RE = re.compile(r'\w+')
+
+# вектор собирается в БД: название (A), ингредиенты (B), текст (C)
+POSTGRESQL_UPDATE = '''
+    UPDATE recipes_recipe SET search_vector =
+        setweight(to_tsvector(%(config)s, name), 'A') ||
+        setweight(to_tsvector(%(config)s, coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_ingredientinrecipe line
+            JOIN recipes_ingredient ingredient
+                ON ingredient.id = line.ingredient_id
+            WHERE line.recipe_id = recipes_recipe.id
+        ), '')), 'B') ||
+        setweight(to_tsvector(%(config)s, text), 'C')
+    WHERE id = ANY(%(ids)s)
+'''
+POSTGRESQL_QUERY = "websearch_to_tsquery(%s, %s)"
+
+# один поток: переиндексации идут по очереди и не занимают много соединений
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search-index')
+
+
+def tokenize(text):
+    """Слова в нижнем регистре; «ё» не отличается от «е»."""
+    return [word[:TOKEN_LENGTH]
+            for word in WORD_RE.findall(text.lower().replace('ё', 'е'))]
+
+
+def update_search_index(recipe_ids):
+    """Пересчёт поискового индекса для рецептов с указанными id."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRESQL_UPDATE,
+                           {'config': SEARCH_CONFIG, 'ids': recipe_ids})
+        return
+
+    weights = {recipe_id: {} for recipe_id in recipe_ids}
+
+    def add_words(recipe_id, text, field):
+        tokens = weights[recipe_id]
+        for token in tokenize(text):
+            tokens[token] = max(tokens.get(token, 0), TOKEN_WEIGHTS[field])
+
+    for recipe_id, name, text in Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('pk', 'name', 'text'):
+        add_words(recipe_id, name, 'name')
+        add_words(recipe_id, text, 'text')
+    for recipe_id, name in IngredientInRecipe.objects.filter(
+            recipe__in=recipe_ids).values_list('recipe', 'ingredient__name'):
+        add_words(recipe_id, name, 'ingredients')
+
+    RecipeSearchToken.objects.filter(recipe__in=recipe_ids).delete()
+    RecipeSearchToken.objects.bulk_create(
+        (RecipeSearchToken(recipe_id=recipe_id, token=token, weight=weight)
+         for recipe_id, tokens in weights.items()
+         for token, weight in tokens.items()),
+        batch_size=1000
+    )
+
+
+def update_search_index_in_batches(recipe_ids, batch_size=BATCH_SIZE):
+    """Пересчёт индекса пачками - по транзакции на пачку."""
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), batch_size):
+        with transaction.atomic():
+            update_search_index(recipe_ids[start:start + batch_size])
+    return len(recipe_ids)
+
+
+def reindex_ingredient(ingredient_id):
+    """Пересчёт индекса рецептов с ингредиентом (после переименования)."""
+    try:
+        update_search_index_in_batches(IngredientInRecipe.objects.filter(
+            ingredient=ingredient_id).values_list('recipe_id', flat=True))
+    except Exception:
+        logger.exception('Search index for ingredient %s failed',
+                         ingredient_id)
+
+
+def reindex_ingredient_in_pool(ingredient_id):
+    try:
+        reindex_ingredient(ingredient_id)
+    finally:
+        # у потока пула своё соединение, иначе оно останется открытым
+        connection.close()
+
+
+def schedule_ingredient_reindex(ingredient_id):
+    """Фоновый пересчёт после фиксации транзакции.
+
+    Популярный ингредиент входит в тысячи рецептов: запрос админки не
+    ждёт пересчёта, а поиск по новому названию заработает чуть позже.
+    """
+    transaction.on_commit(
+        lambda: executor.submit(reindex_ingredient_in_pool, ingredient_id))
+
+
+def token_prefix(term):
+    # диапазон строк, в отличие от LIKE в SQLite, читается по индексу;
+    # совпадение по началу слова заменяет стемминг
+    return Q(token__gte=term, token__lt=term + '\uffff')
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, с оценкой релевантности search_rank.
+
+    PostgreSQL: tsvector с GIN-индексом, русская морфология и синтаксис
+    websearch_to_tsquery. Иначе - все слова запроса должны встретиться
+    в индексе RecipeSearchToken как начала слов рецепта.
+    """
+    if connection.vendor == 'postgresql':
+        params = (SEARCH_CONFIG, query)
+        return queryset.filter(RawSQL(
+            f'recipes_recipe.search_vector @@ {POSTGRESQL_QUERY}', params,
+            output_field=BooleanField()
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank_cd(recipes_recipe.search_vector, {POSTGRESQL_QUERY})',
+            params, output_field=FloatField()
+        ))
+
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_TERMS]
+    if not terms:
+        return queryset.none()
+    # отбор идёт от индекса токенов, а не перебором всех рецептов
+    for term in terms:
+        queryset = queryset.filter(pk__in=RecipeSearchToken.objects.filter(
+            token_prefix(term)).values('recipe'))
+    tokens = RecipeSearchToken.objects.filter(recipe=OuterRef('pk'))
+    any_term = Q()
+    for term in terms:
+        any_term |= token_prefix(term)
+    rank = tokens.filter(any_term).order_by().values('recipe').annotate(
+        total=Sum('weight')).values('total')
+    return queryset.annotate(
+        search_rank=Subquery(rank, output_field=FloatField()))
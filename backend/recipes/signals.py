@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import bump_version
+from .feed import push_recipe
+from .images import schedule_variants_cleanup
+from .models import Ingredient, Recipe, Tag, change_counter, shift_counter
+from .search import schedule_ingredient_reindex
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_reference_version(sender, **kwargs):
+    bump_version(sender._meta.label_lower)
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, created, **kwargs):
+    # название ингредиента входит в поисковый индекс рецептов
+    if not created:
+        schedule_ingredient_reindex(instance.pk)
+
+
+# счётчики рецептов автора - для API, админки и удаления пользователя
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_save, sender=Recipe)
+def push_created_recipe(sender, instance, created, **kwargs):
+    # рецепт из API, админки или скрипта попадает в ленты подписчиков
+    # только после фиксации транзакции, когда ингредиенты уже сохранены
+    if created:
+        transaction.on_commit(lambda: push_recipe(instance))
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_variants(sender, instance, **kwargs):
+    schedule_variants_cleanup(instance.image_variants)
+
+
+@receiver(pre_delete, sender=User)
+def uncount_user_links(sender, instance, **kwargs):
+    """Избранное, корзина и подписки пользователя удаляются каскадом.
+
+    Каскад не вызывает представлений, поэтому счётчики рецептов и
+    авторов уменьшаются здесь, пока связи ещё на месте.
+    """
+    shift_counter(Recipe.objects.filter(user_favorites=instance),
+                  'favorites_count', -1)
+    shift_counter(Recipe.objects.filter(shoppingcart__user=instance),
+                  'in_carts_count', -1)
+    shift_counter(User.objects.filter(following__user=instance),
+                  'followers_count', -1)
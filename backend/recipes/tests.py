@@ -0,0 +1,296 @@
+import random
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from api.filters import RecipeFilter
+from api.shopping_list import cart_ingredients
+from api.views import SubscriptionList
+from users.models import Follow
+from .autocomplete import IngredientPrefixIndex
+from .feed import pushed_keys
+from .models import (FeedItem, Ingredient, IngredientInRecipe, Recipe,
+                     RecipeEvent, ShoppingCart, Tag, change_counter)
+from .popularity import HALF_LIVES, Period, fold_events
+from .search import (reindex_ingredient, reindex_ingredient_in_pool,
+                     search_recipes, update_search_index)
+
+User = get_user_model()
+
+USERS = 300
+RECIPES = 3000
+# справочники из нескольких строк читаются целиком при любом объёме данных
+SMALL_TABLES = ('recipes_tag',)
+
+
+def seed_dataset(users_count, recipes_count, seed=0):
+    """Синтетические пользователи, рецепты и связи через bulk_create."""
+    rnd = random.Random(seed)
+    User.objects.bulk_create(
+        User(username=f'plan_user_{i}', email=f'plan_user_{i}@example.com',
+             first_name='plan', last_name='user')
+        for i in range(users_count)
+    )
+    user_ids = list(User.objects.filter(
+        username__startswith='plan_user_').values_list('id', flat=True))
+    Tag.objects.bulk_create(
+        Tag(name=f'plan tag {i}', slug=f'plan-tag-{i}',
+            color_code=f'#00000{i}')
+        for i in range(3)
+    )
+    tag_ids = list(Tag.objects.filter(
+        slug__startswith='plan-tag-').values_list('id', flat=True))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'plan ingredient {i}', measurement_unit='г')
+        for i in range(200)
+    )
+    ingredient_ids = list(Ingredient.objects.filter(
+        name__startswith='plan ingredient ').values_list('id', flat=True))
+    Recipe.objects.bulk_create(
+        (Recipe(author_id=rnd.choice(user_ids), name=f'plan recipe {i}',
+                text='text', image='recipes/images/plan.png',
+                cooking_time=rnd.randint(1, 120))
+         for i in range(recipes_count)),
+        batch_size=1000
+    )
+    recipe_ids = list(Recipe.objects.filter(
+        name__startswith='plan recipe ').values_list('id', flat=True))
+
+    ingredient_lines, recipe_tags = [], []
+    for recipe_id in recipe_ids:
+        for ingredient_id in rnd.sample(ingredient_ids, 5):
+            ingredient_lines.append(IngredientInRecipe(
+                recipe_id=recipe_id, ingredient_id=ingredient_id, amount=1))
+        recipe_tags.append(Recipe.tags.through(
+            recipe_id=recipe_id, tag_id=rnd.choice(tag_ids)))
+    IngredientInRecipe.objects.bulk_create(ingredient_lines, batch_size=5000)
+    Recipe.tags.through.objects.bulk_create(recipe_tags, batch_size=5000)
+
+    favorites, carts, follows = [], [], []
+    for user_id in user_ids:
+        for recipe_id in rnd.sample(recipe_ids, 10):
+            favorites.append(User.favorites.through(
+                user_id=user_id, recipe_id=recipe_id))
+        for recipe_id in rnd.sample(recipe_ids, 3):
+            carts.append(ShoppingCart(user_id=user_id, recipe_id=recipe_id))
+        for author_id in rnd.sample(user_ids, 5):
+            if author_id != user_id:
+                follows.append(Follow(user_id=user_id, author_id=author_id))
+    User.favorites.through.objects.bulk_create(favorites, batch_size=5000)
+    ShoppingCart.objects.bulk_create(carts, batch_size=5000)
+    Follow.objects.bulk_create(follows, batch_size=5000)
+    return user_ids, tag_ids, ingredient_ids
+
+
+def find_full_scans(plan):
+    """Строки плана с последовательным чтением крупной таблицы."""
+    full_scans = []
+    for line in plan.splitlines():
+        if connection.vendor == 'postgresql':
+            is_full_scan = 'Seq Scan on ' in line
+        else:
+            # SQLite: "SCAN t" - полный просмотр, "SCAN t USING INDEX" - нет
+            is_full_scan = 'SCAN ' in line and 'USING' not in line
+        if is_full_scan and not any(table in line for table in SMALL_TABLES):
+            full_scans.append(line.strip())
+    return full_scans
+
+
+class QueryPlanTest(TestCase):
+    """Горячие запросы читают индексы, а не таблицы целиком."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user_ids, tag_ids, ingredient_ids = seed_dataset(USERS, RECIPES)
+        cls.user = User.objects.get(pk=user_ids[0])
+        cls.author = User.objects.get(pk=user_ids[1])
+        cls.tag = Tag.objects.get(pk=tag_ids[0])
+        cls.ingredient_ids = ingredient_ids[:3]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertEqual(find_full_scans(plan), [], plan)
+        if index is not None:
+            self.assertIn(index, plan)
+
+    def request(self, path, params=None):
+        request = RequestFactory().get(path, params)
+        request.user = self.user
+        return request
+
+    def recipe_list(self, **params):
+        """Queryset списка рецептов с фильтрами так, как его строит API."""
+        request = self.request('/api/recipes/', params)
+        return RecipeFilter(
+            request.GET, queryset=Recipe.objects.for_listing(self.user),
+            request=request).qs
+
+    def test_hot_queries(self):
+        user, author = self.user, self.author
+        subscriptions = SubscriptionList(
+            request=self.request('/api/users/subscriptions/'))
+        # запрос и индекс, которым он должен читаться (None - любой)
+        hot_queries = {
+            'recipe list': (
+                self.recipe_list()[:6], 'recipe_created_ts_id_idx'),
+            'recipe list by author': (
+                self.recipe_list(author=author.pk)[:6],
+                'recipe_author_created_ts_idx'),
+            'recipe list by tag': (
+                self.recipe_list(tags=self.tag.slug)[:6], None),
+            'is_favorited filter': (
+                self.recipe_list(is_favorited=1)[:6], None),
+            'is_in_shopping_cart filter': (
+                self.recipe_list(is_in_shopping_cart=1)[:6],
+                'cart_user_recipe_idx'),
+            'followers of author': (
+                author.following.values_list('user_id', flat=True),
+                'follow_author_user_idx'),
+            'subscriptions': (subscriptions.get_queryset()[:6], None),
+            'shopping list': (
+                cart_ingredients(user), 'cart_user_recipe_idx'),
+            'ingredient match': (
+                self.recipe_list().match_ingredients(
+                    self.ingredient_ids).order_by(
+                        '-coverage', '-matched_count', '-created_ts',
+                        '-id')[:6],
+                'line_ingredient_recipe_idx'),
+            'feed': (pushed_keys(user, None, 6), 'feed_user_created_ts_idx'),
+        }
+        for name, (queryset, index) in hot_queries.items():
+            with self.subTest(name):
+                self.assertUsesIndex(queryset, index)
+
+
+class CounterTest(TestCase):
+    """Счётчики меняются и без API: админка, shell, каскадное удаление."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com')
+        cls.reader = User.objects.create(
+            username='reader', email='reader@example.com')
+
+    def create_recipe(self):
+        return Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст',
+            image='recipes/images/test.png', cooking_time=10)
+
+    def assertCounter(self, obj, field, value):
+        obj.refresh_from_db(fields=[field])
+        self.assertEqual(getattr(obj, field), value)
+
+    def test_recipes_count(self):
+        recipe = self.create_recipe()
+        self.create_recipe()
+        self.assertCounter(self.author, 'recipes_count', 2)
+        recipe.delete()
+        self.assertCounter(self.author, 'recipes_count', 1)
+
+    def test_user_deletion(self):
+        recipe = self.create_recipe()
+        # счётчики через API меняют представления
+        self.reader.favorites.add(recipe)
+        ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=1, in_carts_count=1)
+        User.objects.filter(pk=self.author.pk).update(followers_count=1)
+
+        self.reader.delete()
+        self.assertCounter(recipe, 'favorites_count', 0)
+        self.assertCounter(recipe, 'in_carts_count', 0)
+        self.assertCounter(self.author, 'followers_count', 0)
+
+    def test_feed_push(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = self.create_recipe()
+        self.assertQuerysetEqual(
+            FeedItem.objects.filter(user=self.reader).values_list(
+                'recipe', flat=True), [recipe.pk], transform=None)
+
+    def test_counter_is_not_negative(self):
+        change_counter(User, self.author.pk, 'followers_count', -1)
+        self.assertCounter(self.author, 'followers_count', 0)
+
+
+class SearchIndexTest(TestCase):
+    """Переименование ингредиента переиндексирует рецепты в фоне."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@example.com')
+        cls.ingredient = Ingredient.objects.create(
+            name='редкий корнеплод', measurement_unit='щепоть')
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Текст',
+            image='recipes/images/test.png', cooking_time=10)
+        IngredientInRecipe.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=1)
+        update_search_index([cls.recipe.pk])
+
+    def search(self, query):
+        return list(search_recipes(Recipe.objects.all(), query))
+
+    @mock.patch('recipes.search.executor')
+    def test_rename_ingredient(self, executor):
+        self.assertEqual(self.search('корнеплод'), [self.recipe])
+        self.ingredient.name = 'пастернак'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.save()
+        # запрос, сохранивший ингредиент, индекс не пересчитывает
+        executor.submit.assert_called_once_with(
+            reindex_ingredient_in_pool, self.ingredient.pk)
+        self.assertEqual(self.search('пастернак'), [])
+
+        reindex_ingredient(self.ingredient.pk)
+        self.assertEqual(self.search('пастернак'), [self.recipe])
+        self.assertEqual(self.search('корнеплод'), [])
+
+
+class PopularityTest(TestCase):
+    """Вклад события уменьшается вдвое за период полураспада."""
+
+    def test_fold_events(self):
+        now = timezone.now()
+        half_life = HALF_LIVES[Period.TRENDING]
+        events = [
+            (1, RecipeEvent.Kind.FAVORITE, now),
+            (2, RecipeEvent.Kind.FAVORITE, now - half_life),
+            (2, RecipeEvent.Kind.CART, now - half_life),
+        ]
+        increments = fold_events(events, now)
+        self.assertEqual(set(increments), set(Period))
+        trending = increments[Period.TRENDING]
+        self.assertAlmostEqual(trending[1], 1.0)
+        self.assertAlmostEqual(trending[2], 0.75)
+        # без затухания старые события весят как новые
+        self.assertAlmostEqual(increments[Period.ALL][2], 1.5)
+        self.assertLess(increments[Period.HOT][2], trending[2])
+        self.assertGreater(increments[Period.STEADY][2], trending[2])
+
+
+class IngredientPrefixIndexTest(TestCase):
+    """Индекс автодополнения собирается заново только при смене версии."""
+
+    def test_rebuild(self):
+        index = IngredientPrefixIndex()
+        self.assertEqual(index.search('ксилофон'), [])
+        # индекс свежий: ни повторной сборки, ни запросов к БД
+        with self.assertNumQueries(0):
+            index.rebuild()
+            index.search('ксилофон')
+
+        ingredient = Ingredient.objects.create(
+            name='Ксилофонник', measurement_unit='шт.')
+        self.assertEqual(index.search('ксилофон'), [{
+            'id': ingredient.pk, 'name': 'Ксилофонник',
+            'measurement_unit': 'шт.'}])
@@ -12,6 +12,10 @@ class User(AbstractUser):
         related_name='user_favorites',
         verbose_name='Избранные рецепты'
     )
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -46,6 +50,10 @@ class Follow(models.Model):
             models.UniqueConstraint(
                 fields=['user', 'author'], name='unique_user_author_pair')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
 
     def __str__(self):
         return f'Author {self.author.username} - User {self.user.username}'